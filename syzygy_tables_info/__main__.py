@@ -1,5 +1,10 @@
 import sys
 
+if "--profile-startup" in sys.argv:
+    import syzygy_tables_info.startup
+
+    syzygy_tables_info.startup.install()
+
 import syzygy_tables_info.server
 
 
@@ -0,0 +1,46 @@
+import hashlib
+import os
+
+from typing import Dict, Optional
+
+
+STATIC = os.path.join(os.path.dirname(__file__), "..", "static")
+
+
+class Manifest:
+    def __init__(self, hashes: Dict[str, str]) -> None:
+        # Content hashes by path relative to the static directory.
+        self.hashes = hashes
+
+    @classmethod
+    def build(cls, root: str = STATIC) -> "Manifest":
+        hashes = {}
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()[:16]
+                hashes[os.path.relpath(path, root).replace(os.sep, "/")] = digest
+        return cls(hashes)
+
+    def url(self, path: str) -> str:
+        digest = self.hashes.get(path)
+        return f"/static/{path}?v={digest}" if digest else f"/static/{path}"
+
+    def fingerprinted(self, request_path: str, version: Optional[str]) -> bool:
+        # Only the current version of an asset may be cached forever. Stale
+        # pages can still refer to older versions, which are then served
+        # with the current content.
+        if version is None or not request_path.startswith("/static/"):
+            return False
+        return self.hashes.get(request_path[len("/static/"):]) == version
+
+
+MANIFEST: Optional[Manifest] = None
+
+
+def manifest() -> Manifest:
+    global MANIFEST
+    if MANIFEST is None:
+        MANIFEST = Manifest.build()
+    return MANIFEST
@@ -0,0 +1,325 @@
+import asyncio
+import collections
+import logging
+import math
+import time
+
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Protocol, Tuple
+
+import aiohttp
+import aiohttp.web
+import cbor2
+
+from syzygy_tables_info.model import ApiResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackendError(Exception):
+    def __init__(
+        self,
+        status: int,
+        content_type: str,
+        charset: Optional[str],
+        body: bytes,
+        *,
+        retry_after: Optional[int] = None,
+    ) -> None:
+        super().__init__(f"backend responded with status {status}")
+        self.status = status
+        self.content_type = content_type
+        self.charset = charset
+        self.body = body
+        self.retry_after = retry_after
+
+    def response(self) -> aiohttp.web.Response:
+        response = aiohttp.web.Response(
+            status=self.status,
+            content_type=self.content_type,
+            body=self.body,
+            charset=self.charset,
+        )
+        # Failures are transient, and must not be cached by proxies.
+        response.headers["Cache-Control"] = "no-store"
+        if self.retry_after is not None:
+            response.headers["Retry-After"] = str(self.retry_after)
+        return response
+
+
+class BackendResponse(NamedTuple):
+    status: int
+    content_type: str
+    charset: Optional[str]
+    body: bytes
+
+
+class TablebaseBackend(Protocol):
+    # Results come with their size in bytes, for cache accounting. Failures
+    # (including positions not found, for mainlines) raise BackendError.
+    async def probe(self, fen: str, *, headers: Dict[str, str]) -> Tuple[ApiResponse, int]: ...
+
+    async def mainline(self, fen: str, *, headers: Dict[str, str]) -> Tuple[Dict[str, Any], int]: ...
+
+    async def close(self, app: aiohttp.web.Application) -> None: ...
+
+
+class Backend:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+    def healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+
+class CircuitBreaker:
+    def __init__(self, *, threshold: float, window: int, min_requests: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+
+        # Outcomes of the most recent requests.
+        self.outcomes: Deque[bool] = collections.deque(maxlen=window)
+        self.errors = 0
+        self.open_until = 0.0
+
+        self.trips = 0
+        self.rejected = 0
+
+    def is_open(self) -> bool:
+        return self.open_until > time.monotonic()
+
+    def allow(self) -> bool:
+        if self.is_open():
+            self.rejected += 1
+            return False
+        return True
+
+    def record(self, ok: bool) -> None:
+        if not self.threshold:
+            return
+
+        if len(self.outcomes) == self.outcomes.maxlen and not self.outcomes[0]:
+            self.errors -= 1
+        self.outcomes.append(ok)
+        if not ok:
+            self.errors += 1
+
+        if len(self.outcomes) >= self.min_requests and self.errors >= self.threshold * len(self.outcomes):
+            # Open. Once the cooldown has passed, requests are let through
+            # again, and need to fail just as often to trip again.
+            logger.error("Circuit breaker open, %d of %d backend requests failed", self.errors, len(self.outcomes))
+            self.open_until = time.monotonic() + self.cooldown
+            self.outcomes.clear()
+            self.errors = 0
+            self.trips += 1
+
+
+class BackendPool:
+    def __init__(
+        self,
+        urls: List[str],
+        *,
+        limit: int,
+        limit_per_host: int,
+        keepalive: float,
+        connect_timeout: float,
+        timeout: float,
+        max_failures: int,
+        ejection_time: float,
+        hedge_percentile: float,
+        hedge_min_delay: float,
+        breaker: CircuitBreaker,
+    ) -> None:
+        assert urls, "at least one backend required"
+        self.backends = [Backend(url) for url in urls]
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.breaker = breaker
+
+        # Recent latencies of hedgeable requests.
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies: Deque[float] = collections.deque(maxlen=1000)
+        self.samples_since_delay = 0
+        self.delay: Optional[float] = None
+
+        self.hedged = 0
+        self.hedge_wins = 0
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=limit,
+                limit_per_host=limit_per_host,
+                keepalive_timeout=keepalive,
+            ),
+            timeout=aiohttp.ClientTimeout(
+                total=timeout,
+                sock_connect=connect_timeout,
+            ),
+        )
+
+    async def close(self, app: aiohttp.web.Application) -> None:
+        await self.session.close()
+
+    def pick(self, exclude: List[Backend]) -> Optional[Backend]:
+        # Least outstanding requests among healthy backends. If all are
+        # ejected, fail open and try the one that is due back soonest.
+        now = time.monotonic()
+        candidates = [backend for backend in self.backends if backend not in exclude]
+        if not candidates:
+            return None
+        healthy = [backend for backend in candidates if backend.healthy(now)]
+        if healthy:
+            return min(healthy, key=lambda backend: backend.outstanding)
+        return min(candidates, key=lambda backend: backend.ejected_until)
+
+    def succeeded(self, backend: Backend) -> None:
+        backend.failures = 0
+        self.breaker.record(True)
+
+    def failed(self, backend: Backend) -> None:
+        self.breaker.record(False)
+        backend.errors += 1
+        backend.failures += 1
+        if backend.failures >= self.max_failures:
+            backend.failures = 0
+            backend.ejected_until = time.monotonic() + self.ejection_time
+            backend.ejections += 1
+            logger.warning("Ejecting backend %s for %.0fs", backend.url, self.ejection_time)
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge_percentile or len(self.latencies) < 50:
+            return None
+
+        # Recompute only every so often, sorting is not free.
+        if self.samples_since_delay >= 50 or self.delay is None:
+            self.samples_since_delay = 0
+            ordered = sorted(self.latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+            self.delay = max(self.hedge_min_delay, ordered[index])
+        return self.delay
+
+    def record_latency(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.samples_since_delay += 1
+
+    async def probe(self, fen: str, *, headers: Dict[str, str]) -> Tuple[ApiResponse, int]:
+        res = await self.fetch("", params={"fen": fen}, headers=headers, hedge=True)
+        if res.status != 200:
+            raise BackendError(res.status, res.content_type, res.charset, res.body)
+        probe: ApiResponse = cbor2.loads(res.body)
+        return probe, len(res.body)
+
+    async def mainline(self, fen: str, *, headers: Dict[str, str]) -> Tuple[Dict[str, Any], int]:
+        res = await self.fetch("/mainline", params={"fen": fen}, headers=headers)
+        if res.status != 200:
+            raise BackendError(res.status, res.content_type, res.charset, res.body)
+        return cbor2.loads(res.body), len(res.body)
+
+    async def fetch(
+        self, path: str, *, params: Dict[str, str], headers: Dict[str, str], hedge: bool = False
+    ) -> BackendResponse:
+        if not self.breaker.allow():
+            raise BackendError(
+                503,
+                "text/plain",
+                "utf-8",
+                b"The tablebase backend is currently failing. Please try again in a few seconds.",
+                retry_after=max(1, math.ceil(self.breaker.open_until - time.monotonic())),
+            )
+
+        delay = self.hedge_delay() if hedge else None
+        if delay is None:
+            return await self._fetch(path, params, headers, sample=hedge)
+
+        # Hedge: if the first request is slower than most, send another one,
+        # preferably to a different backend, and take whichever completes
+        # first.
+        used: List[Backend] = []
+        tasks = [asyncio.create_task(self._fetch(path, params, headers, used=used, sample=True))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+
+            self.hedged += 1
+            tasks.append(asyncio.create_task(self._fetch(path, params, headers, avoid=list(used), sample=True)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # A fast server error does not win the race.
+                    if task.exception() is None and task.result().status < 500:
+                        if task is tasks[1]:
+                            self.hedge_wins += 1
+                        return task.result()
+
+            # Both failed.
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch(
+        self,
+        path: str,
+        params: Dict[str, str],
+        headers: Dict[str, str],
+        *,
+        avoid: Optional[List[Backend]] = None,
+        used: Optional[List[Backend]] = None,
+        sample: bool = False,
+    ) -> BackendResponse:
+        # Requests are idempotent, so if a backend cannot be reached at all,
+        # fail over to the next one. Other errors are not retried, to avoid
+        # multiplying load on a backend that is merely slow.
+        tried: List[Backend] = []
+        while True:
+            backend = self.pick(tried + (avoid or [])) or self.pick(tried)
+            if backend is None:
+                raise BackendError(502, "text/plain", "utf-8", b"tablebase backend unavailable")
+            tried.append(backend)
+            if used is not None:
+                used.append(backend)
+
+            backend.requests += 1
+            backend.outstanding += 1
+            started = time.monotonic()
+            try:
+                async with self.session.get(backend.url + path, params=params, headers=headers) as res:
+                    body = await res.read()
+            except aiohttp.ClientConnectorError as err:
+                logger.warning("Backend %s unreachable: %s", backend.url, err)
+                self.failed(backend)
+                continue
+            except asyncio.TimeoutError:
+                self.failed(backend)
+                raise BackendError(504, "text/plain", "utf-8", b"tablebase backend timed out")
+            except aiohttp.ClientError as err:
+                self.failed(backend)
+                logger.warning("Backend %s failed: %s", backend.url, err)
+                raise BackendError(502, "text/plain", "utf-8", b"tablebase backend failed")
+            except asyncio.CancelledError:
+                # Cancelled by a faster hedged request. The elapsed time is
+                # still a useful lower bound for the latency distribution.
+                if sample:
+                    self.record_latency(time.monotonic() - started)
+                raise
+            finally:
+                backend.outstanding -= 1
+
+            if sample:
+                self.record_latency(time.monotonic() - started)
+            if res.status >= 500:
+                self.failed(backend)
+            else:
+                self.succeeded(backend)
+            return BackendResponse(res.status, res.content_type, res.charset, body)
@@ -0,0 +1,106 @@
+import asyncio
+import collections
+import functools
+import time
+
+from typing import Any, Callable, Coroutine, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LruCache(Generic[K, V]):
+    def __init__(self, *, max_entries: int, max_bytes: int, ttl: float = 0) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.entries: collections.OrderedDict[K, Tuple[V, int, float]] = collections.OrderedDict()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: K) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and not (entry[2] and entry[2] < time.monotonic())
+
+    def get(self, key: K) -> Optional[V]:
+        try:
+            value, size, expires = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        if expires and expires < time.monotonic():
+            del self.entries[key]
+            self.bytes -= size
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: K, value: V, size: int) -> None:
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+
+        self.entries[key] = (value, size, time.monotonic() + self.ttl if self.ttl > 0 else 0)
+        self.bytes += size
+
+        # Evict least recently used entries until both limits hold.
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+
+class Flight(Generic[V]):
+    def __init__(self, task: "asyncio.Task[V]") -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[K, V]):
+    def __init__(self) -> None:
+        self.flights: Dict[K, Flight[V]] = {}
+
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key: K, fn: Callable[[], Coroutine[Any, Any, V]]) -> V:
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = self.flights[key] = Flight(asyncio.create_task(fn()))
+            flight.task.add_done_callback(functools.partial(self._forget, key, flight))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        # Shield the shared task, so that it survives any single waiter
+        # (including the one that started it) being cancelled.
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Last one waiting. Nobody is interested in the result anymore.
+                self._forget(key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: K, flight: Flight[V], _task: Optional["asyncio.Task[V]"] = None) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
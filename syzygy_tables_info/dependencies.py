@@ -0,0 +1,64 @@
+import functools
+
+from typing import Any, Iterable, Iterator, List, Tuple
+
+import chess.syzygy
+
+
+def sort_key(endgame: str) -> Any:
+    w, b = endgame.split("v", 1)
+    return (
+        len(endgame),
+        len(w),
+        [-chess.syzygy.PCHR.index(p) for p in w],
+        len(b),
+        [-chess.syzygy.PCHR.index(p) for p in b],
+    )
+
+
+class DependencyGraph:
+    def __init__(self, names: Iterable[str]) -> None:
+        # Tables are indexed in download order, so that sorting indexes is
+        # the same as sorting by sort_key.
+        self.names = sorted(names, key=sort_key)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.deps: List[Tuple[int, ...]] = [
+            tuple(self.index[dep] for dep in chess.syzygy.dependencies(name))
+            for name in self.names
+        ]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def closure(self, roots: Iterable[str]) -> Iterator[str]:
+        # Same as chess.syzygy.all_dependencies(), but in download order.
+        closed = bytearray(len(self.names))
+        open_list = [self.index[root] for root in roots]
+        while open_list:
+            i = open_list.pop()
+            if not closed[i]:
+                closed[i] = 1
+                open_list.extend(self.deps[i])
+
+        return (self.names[i] for i, c in enumerate(closed) if c)
+
+    def edges(self, roots: List[str]) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+        # Depth-first traversal in the order of the original graph.dot
+        # implementation, yielding each table with its direct dependencies.
+        closed = bytearray(len(self.names))
+        target = [self.index[root] for root in roots]
+        while target:
+            i = target.pop()
+            if closed[i]:
+                continue
+
+            deps = self.deps[i]
+            target.extend(deps)
+            yield self.names[i], tuple(self.names[dep] for dep in deps)
+
+            closed[i] = 1
+
+
+@functools.lru_cache(maxsize=None)
+def graph() -> DependencyGraph:
+    return DependencyGraph(chess.syzygy.tablenames(piece_count=chess.syzygy.TBPIECES))
@@ -0,0 +1,195 @@
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp.web
+import cbor2
+import chess
+import chess.syzygy
+
+from syzygy_tables_info.backend import BackendError
+from syzygy_tables_info.model import ApiCategory, ApiMove, ApiResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+# Opened once in each process of the pool.
+TABLEBASE: Optional[chess.syzygy.Tablebase] = None
+
+
+def open_tablebase(directories: List[str]) -> None:
+    global TABLEBASE
+    TABLEBASE = chess.syzygy.Tablebase()
+    for directory in directories:
+        TABLEBASE.add_directory(directory)
+
+
+def category(dtz: int, halfmove_clock: int) -> ApiCategory:
+    # DTZ may be rounded up to one ply, so exactly reaching the 50-move
+    # limit is ambiguous.
+    if dtz == 0:
+        return "draw"
+    elif abs(dtz) + halfmove_clock < 100:
+        return "win" if dtz > 0 else "loss"
+    elif abs(dtz) + halfmove_clock == 100:
+        return "maybe-win" if dtz > 0 else "maybe-loss"
+    else:
+        return "cursed-win" if dtz > 0 else "blessed-loss"
+
+
+def probe_position(board: chess.Board) -> Dict[str, Any]:
+    assert TABLEBASE is not None
+    info: Dict[str, Any] = {
+        "checkmate": board.is_checkmate(),
+        "stalemate": board.is_stalemate(),
+        "insufficient_material": board.is_insufficient_material(),
+    }
+    if info["checkmate"]:
+        info["category"] = "loss"
+        info["dtz"] = 0
+        info["precise_dtz"] = 0
+    elif info["stalemate"] or info["insufficient_material"]:
+        info["category"] = "draw"
+        info["dtz"] = 0
+        info["precise_dtz"] = 0
+    else:
+        dtz = TABLEBASE.get_dtz(board)
+        if dtz is None:
+            info["category"] = "unknown"
+        else:
+            info["category"] = category(dtz, board.halfmove_clock)
+            info["dtz"] = dtz
+    return info
+
+
+def probe_fen(fen: str) -> Tuple[ApiResponse, int]:
+    board = chess.Board(fen)
+    moves: List[ApiMove] = []
+    for move in board.legal_moves:
+        san = board.san(move)
+        zeroing = board.is_zeroing(move)
+        board.push(move)
+        try:
+            api_move: ApiMove = {"uci": move.uci(), "san": san, "zeroing": zeroing, **probe_position(board)}  # type: ignore
+        finally:
+            board.pop()
+        moves.append(api_move)
+
+    response: ApiResponse = {**probe_position(board), "moves": moves}  # type: ignore
+
+    # Sized like the CBOR responses of the HTTP backend, so that both count
+    # the same against the probe cache.
+    return response, len(cbor2.dumps(response))
+
+
+def best_move(board: chess.Board, dtz: int) -> Optional[Tuple[chess.Move, int]]:
+    # The winning side keeps the win under the 50-move rule if possible and
+    # makes progress towards the next zeroing move. The losing side hopes
+    # for a blessed loss and delays.
+    assert TABLEBASE is not None
+    best: Optional[Tuple[Tuple[bool, bool, bool, int], chess.Move, int]] = None
+    for move in board.legal_moves:
+        zeroing = board.is_zeroing(move)
+        board.push(move)
+        try:
+            checkmate = board.is_checkmate()
+            child_dtz = 0 if checkmate else TABLEBASE.get_dtz(board)
+        finally:
+            board.pop()
+
+        if child_dtz is None or (not checkmate and (child_dtz == 0 or (child_dtz < 0) != (dtz > 0))):
+            continue
+        elif dtz > 0:
+            key = (checkmate, child_dtz >= -100, zeroing, child_dtz)
+        else:
+            key = (False, child_dtz > 100, not zeroing, child_dtz)
+
+        if best is None or key > best[0]:
+            best = key, move, child_dtz
+    return None if best is None else (best[1], best[2])
+
+
+def mainline_fen(fen: str) -> Tuple[Optional[Dict[str, Any]], int]:
+    assert TABLEBASE is not None
+    board = chess.Board(fen)
+    dtz = TABLEBASE.get_dtz(board)
+    if dtz is None:
+        return None, 0
+
+    winner = None
+    if category(dtz, board.halfmove_clock) in ["win", "maybe-win"]:
+        winner = "w" if board.turn == chess.WHITE else "b"
+    elif category(dtz, board.halfmove_clock) in ["loss", "maybe-loss"]:
+        winner = "b" if board.turn == chess.WHITE else "w"
+
+    # Follow DTZ until the game ends, or is drawn by the 50-move rule.
+    moves: List[Dict[str, Any]] = []
+    current = dtz
+    while current and board.halfmove_clock < 100:
+        found = best_move(board, current)
+        if found is None:
+            break
+        move, current = found
+        moves.append({"uci": move.uci(), "san": board.san(move), "dtz": current})
+        board.push(move)
+
+    result = {"dtz": dtz, "mainline": moves, "winner": winner}
+    return result, len(cbor2.dumps(result))
+
+
+class LocalBackend:
+    def __init__(self, directories: List[str], *, processes: int) -> None:
+        assert directories, "at least one tablebase directory required"
+        self.directories = directories
+        self.processes = processes
+        self.executor = self.create_executor()
+
+        self.probes = 0
+        self.mainlines = 0
+        self.in_flight = 0
+
+    def create_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        # Spawned rather than forked, since the server process has an event
+        # loop and threads running.
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=open_tablebase,
+            initargs=(self.directories,),
+        )
+
+    async def close(self, app: aiohttp.web.Application) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn: Any, fen: str) -> Any:
+        # Table lookups block on disk, so they never run on the event loop.
+        executor = self.executor
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, fen)
+        except concurrent.futures.BrokenExecutor:
+            if executor is self.executor:
+                logger.error("Tablebase process pool broken, restarting")
+                self.executor = self.create_executor()
+            raise BackendError(503, "text/plain", "utf-8", b"local tablebase unavailable", retry_after=1)
+        except Exception:
+            logger.exception("Local tablebase probe failed for %s", fen)
+            raise BackendError(500, "text/plain", "utf-8", b"local tablebase probe failed")
+        finally:
+            self.in_flight -= 1
+
+    async def probe(self, fen: str, *, headers: Dict[str, str]) -> Tuple[ApiResponse, int]:
+        self.probes += 1
+        result: Tuple[ApiResponse, int] = await self.run(probe_fen, fen)
+        return result
+
+    async def mainline(self, fen: str, *, headers: Dict[str, str]) -> Tuple[Dict[str, Any], int]:
+        self.mainlines += 1
+        result, size = await self.run(mainline_fen, fen)
+        if result is None:
+            raise BackendError(404, "text/plain", "utf-8", b"position not found in tablebases")
+        return result, size
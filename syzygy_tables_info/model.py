@@ -50,6 +50,14 @@ class ApiResponse(TypedDict):
     moves: List[ApiMove]
 
 
+class BatchResult(TypedDict):
+    index: List[int]
+    input: NotRequired[str]
+    fen: NotRequired[str]
+    probe: NotRequired[ApiResponse]
+    error: NotRequired[str]
+
+
 class RenderMove(TypedDict):
     uci: str
     san: str
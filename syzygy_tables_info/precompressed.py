@@ -0,0 +1,206 @@
+import gzip
+import hashlib
+import mmap
+import os
+import sys
+
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import aiohttp.web
+import brotli  # type: ignore[import-untyped]
+
+
+Body = Union[bytes, memoryview]
+
+
+def accepted_encodings(request: aiohttp.web.Request) -> Dict[str, float]:
+    accepted = {}
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            accepted[coding.lower()] = q
+    return accepted
+
+
+def compressors(brotli_quality: int) -> List[Tuple[str, str, Callable[[Body], bytes]]]:
+    return [
+        ("br", ".br", lambda body: bytes(brotli.compress(bytes(body), quality=brotli_quality))),
+        ("gzip", ".gz", lambda body: gzip.compress(body, compresslevel=9, mtime=0)),
+    ]
+
+
+def map_file(path: str) -> Body:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def build_siblings(path: str, *, brotli_quality: int = 11) -> None:
+    # Write path.br and path.gz next to path, unless they are up to date.
+    mtime = os.path.getmtime(path)
+    source: Optional[Body] = None
+    for _, ext, compress in compressors(brotli_quality):
+        sibling = path + ext
+        try:
+            if os.path.getmtime(sibling) >= mtime:
+                continue
+        except FileNotFoundError:
+            pass
+
+        if source is None:
+            source = map_file(path)
+        tmp = f"{sibling}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(compress(source))
+        os.replace(tmp, sibling)
+
+
+class Precompressed:
+    def __init__(
+        self,
+        variants: Dict[str, Body],
+        *,
+        etag: str,
+        content_type: str,
+        charset: Optional[str] = None,
+    ) -> None:
+        self.content_type = content_type
+        self.charset = charset
+        self.etag = etag
+
+        # Variants by content coding, preferred first. Compressed variants
+        # are only kept if they actually save space.
+        self.variants: Dict[str, Tuple[Body, str]] = {}
+        identity = variants["identity"]
+        for coding, body in variants.items():
+            if coding != "identity" and len(body) < len(identity):
+                self.variants[coding] = (body, f"{etag}-{coding}")
+        self.variants["identity"] = (identity, etag)
+
+    @classmethod
+    def compress(
+        cls,
+        body: bytes,
+        *,
+        content_type: str,
+        charset: Optional[str] = None,
+        brotli_quality: int = 11,
+        min_size: int = 256,
+    ) -> "Precompressed":
+        variants: Dict[str, Body] = {}
+        if len(body) >= min_size:
+            for coding, _, compress in compressors(brotli_quality):
+                variants[coding] = compress(body)
+        variants["identity"] = body
+        return cls(
+            variants,
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            content_type=content_type,
+            charset=charset,
+        )
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        *,
+        content_type: str,
+        charset: Optional[str] = None,
+        brotli_quality: int = 11,
+    ) -> "Precompressed":
+        # Files are memory-mapped rather than read, so that all workers
+        # share them through the page cache. Siblings are only built ahead
+        # of time, never written while serving. If they are missing or
+        # outdated, compress in memory instead.
+        variants: Dict[str, Body] = {}
+        variants["identity"] = identity = map_file(path)
+        mtime = os.path.getmtime(path)
+        for coding, ext, compress in compressors(brotli_quality):
+            try:
+                if os.path.getmtime(path + ext) >= mtime:
+                    variants[coding] = map_file(path + ext)
+                    continue
+            except OSError:
+                pass
+            variants[coding] = compress(identity)
+        return cls(
+            variants,
+            etag=hashlib.sha256(identity).hexdigest()[:32],
+            content_type=content_type,
+            charset=charset,
+        )
+
+    @property
+    def size(self) -> int:
+        return sum(len(body) for body, _ in self.variants.values())
+
+    def select(self, request: aiohttp.web.Request) -> Tuple[str, Body, str]:
+        accepted = accepted_encodings(request)
+        for coding, (body, etag) in self.variants.items():
+            if coding == "identity" or accepted.get(coding, accepted.get("*", 0)) > 0:
+                return coding, body, etag
+        raise AssertionError("identity is always acceptable")
+
+    def not_modified(self, request: aiohttp.web.Request, etag: str) -> bool:
+        if_none_match = request.if_none_match
+        return bool(if_none_match) and any(
+            candidate.value in [etag, "*"] for candidate in if_none_match or ()
+        )
+
+    def response(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        coding, body, etag = self.select(request)
+
+        if self.not_modified(request, etag):
+            # Keeps the content type, which cache policies may depend on.
+            response = aiohttp.web.Response(status=304, content_type=self.content_type, charset=self.charset)
+        else:
+            try:
+                requested = request.http_range
+            except ValueError:
+                requested = slice(None, None)
+
+            # Ignore ranges if the client holds a different representation.
+            if_range = request.headers.get("If-Range")
+            if if_range is not None and if_range.strip('"') != etag:
+                requested = slice(None, None)
+
+            if requested.start is None and requested.stop is None:
+                response = aiohttp.web.Response(
+                    body=body, content_type=self.content_type, charset=self.charset
+                )
+            else:
+                start, stop, _ = requested.indices(len(body))
+                if start >= stop:
+                    response = aiohttp.web.Response(status=416)
+                    response.headers["Content-Range"] = f"bytes */{len(body)}"
+                else:
+                    response = aiohttp.web.Response(
+                        status=206,
+                        body=body[start:stop],
+                        content_type=self.content_type,
+                        charset=self.charset,
+                    )
+                    response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{len(body)}"
+
+            response.headers["Accept-Ranges"] = "bytes"
+            if coding != "identity":
+                response.headers["Content-Encoding"] = coding
+
+        response.etag = etag
+        if len(self.variants) > 1:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        build_siblings(path)
@@ -0,0 +1,91 @@
+import asyncio
+import collections
+import itertools
+
+from typing import Any, Callable, Coroutine, Dict, Iterable, List, Tuple
+
+import aiohttp.web
+
+from syzygy_tables_info.ratelimit import TokenBuckets
+
+
+class Prefetcher:
+    def __init__(
+        self,
+        fetch: Callable[[str, Dict[str, str]], Coroutine[Any, Any, bool]],
+        *,
+        moves: int,
+        concurrency: int,
+        queue_size: int,
+        rate: float,
+        burst: float,
+        max_clients: int,
+    ) -> None:
+        self.fetch = fetch
+        self.moves = moves
+        self.concurrency = concurrency
+
+        self.queue: asyncio.Queue[Tuple[str, Dict[str, str]]] = asyncio.Queue(maxsize=queue_size)
+        self.workers: List[asyncio.Task[None]] = []
+        self.limits = TokenBuckets(rate=rate, burst=burst, max_clients=max_clients)
+
+        # Positions that were fetched speculatively and not yet requested.
+        self.warmed: collections.OrderedDict[str, None] = collections.OrderedDict()
+        self.max_warmed = max(queue_size, 1) * max(moves, 1) * 16
+
+        self.scheduled = 0
+        self.rate_limited = 0
+        self.dropped = 0
+        self.fetched = 0
+        self.failed = 0
+        self.hits = 0
+
+    def schedule(self, remote: str, fens: Iterable[str], headers: Dict[str, str]) -> None:
+        if not self.limits.take(remote):
+            self.rate_limited += 1
+            return
+
+        for fen in itertools.islice(fens, self.moves):
+            try:
+                self.queue.put_nowait((fen, headers))
+            except asyncio.QueueFull:
+                # Backpressure: Prefetching is only an optimization, so
+                # rather skip it than queue up work that will be stale.
+                self.dropped += 1
+            else:
+                self.scheduled += 1
+
+    def used(self, fen: str) -> None:
+        try:
+            del self.warmed[fen]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+
+    async def start(self, app: aiohttp.web.Application) -> None:
+        self.workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self, app: aiohttp.web.Application) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def _work(self) -> None:
+        while True:
+            fen, headers = await self.queue.get()
+            try:
+                fetched = await self.fetch(fen, headers)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+            else:
+                if fetched:
+                    self.fetched += 1
+                    self.warmed[fen] = None
+                    if len(self.warmed) > self.max_warmed:
+                        self.warmed.popitem(last=False)
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,123 @@
+import asyncio
+import collections
+import math
+import time
+
+from typing import Awaitable, Callable, Set, Tuple
+
+import aiohttp.web
+
+
+class TokenBuckets:
+    def __init__(self, *, rate: float, burst: float, max_clients: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+
+        # Least recently seen clients first. Forgetting a client is the same
+        # as giving it a full bucket, so memory is bounded without locking
+        # anyone out.
+        self.buckets: collections.OrderedDict[str, Tuple[float, float]] = collections.OrderedDict()
+
+    def take(self, key: str, tokens: float = 1) -> bool:
+        now = time.monotonic()
+        level, last = self.buckets.pop(key, (self.burst, now))
+        level = min(self.burst, level + (now - last) * self.rate)
+
+        # Costs larger than the burst are admitted on a full bucket, leaving
+        # it in debt.
+        allowed = level >= min(tokens, self.burst)
+        if allowed:
+            level -= tokens
+
+        self.buckets[key] = (level, now)
+        if len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+
+        return allowed
+
+
+class AdmissionControl:
+    def __init__(
+        self,
+        *,
+        routes: Set[str],
+        metered: Set[str],
+        rate: float,
+        burst: float,
+        max_clients: int,
+        concurrency: int,
+        queue: int,
+        queue_timeout: float,
+    ) -> None:
+        self.routes = routes
+        self.metered = metered
+        self.rate = rate
+        self.limits = TokenBuckets(rate=rate, burst=burst, max_clients=max_clients)
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(max(concurrency, 1))
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self.waiting = 0
+
+        self.admitted = 0
+        self.rate_limited = 0
+        self.shed = 0
+
+    def overloaded(self) -> aiohttp.web.HTTPServiceUnavailable:
+        self.shed += 1
+        return aiohttp.web.HTTPServiceUnavailable(
+            text="Server overloaded. Please try again in a few seconds.",
+            headers={"Retry-After": str(max(1, math.ceil(self.queue_timeout)))},
+        )
+
+    def charge(self, request: aiohttp.web.Request, tokens: float = 1) -> None:
+        if self.rate > 0 and tokens > 0 and not self.limits.take(request.remote or "127.0.0.1", tokens):
+            self.rate_limited += 1
+            raise aiohttp.web.HTTPTooManyRequests(
+                text="Too many requests. Please slow down.",
+                headers={"Retry-After": str(max(1, math.ceil(min(tokens, self.limits.burst) / self.rate)))},
+            )
+
+    @aiohttp.web.middleware
+    async def middleware(
+        self,
+        request: aiohttp.web.Request,
+        handler: Callable[[aiohttp.web.Request], Awaitable[aiohttp.web.StreamResponse]],
+    ) -> aiohttp.web.StreamResponse:
+        # Only routes that query the backend are limited.
+        resource = request.match_info.route.resource
+        if resource is None or resource.canonical not in self.routes:
+            return await handler(request)
+
+        # Metered routes charge for the work they actually do.
+        if resource.canonical not in self.metered:
+            self.charge(request)
+
+        if self.concurrency <= 0:
+            return await handler(request)
+
+        # Wait for a slot, but shed load rather than letting the queue (and
+        # everyone's latency) grow without bound.
+        if self.semaphore.locked():
+            if self.waiting >= self.queue:
+                raise self.overloaded()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self.overloaded()
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+
+        self.admitted += 1
+        self.active += 1
+        try:
+            return await handler(request)
+        finally:
+            self.active -= 1
+            self.semaphore.release()
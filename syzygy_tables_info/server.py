@@ -1,23 +1,40 @@
+import argparse
 import asyncio
 import configparser
+import functools
 import random
 import datetime
 import itertools
+import json
 import logging
 import math
+import mimetypes
 import os
+import socket
 import textwrap
-from typing import Any, Awaitable, Callable, Dict, List, Optional
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 
 import aiohttp.web
 import cbor2
 import chess
-import chess.pgn
 import chess.syzygy
+from tinyhtml import Frag
 
+import syzygy_tables_info.assets
 import syzygy_tables_info.views
+from syzygy_tables_info.backend import BackendError, BackendPool, CircuitBreaker, TablebaseBackend
+from syzygy_tables_info.cache import LruCache, SingleFlight
+from syzygy_tables_info.local import LocalBackend
+from syzygy_tables_info.dependencies import graph
+from syzygy_tables_info.precompressed import Precompressed
+from syzygy_tables_info.prefetch import Prefetcher
+from syzygy_tables_info.ratelimit import AdmissionControl
+from syzygy_tables_info.telemetry import Telemetry
 from syzygy_tables_info.model import (
+    ApiMove,
     ApiResponse,
+    BatchResult,
     ColorName,
     Render,
     RenderMove,
@@ -33,12 +50,29 @@ kib = syzygy_tables_info.views.kib
 
 
 def static(path: str, content_type: Optional[str] = None) -> Any:
-    def handler(request: aiohttp.web.Request) -> aiohttp.web.FileResponse:
-        headers = {"Content-Type": content_type} if content_type else None
-        return aiohttp.web.FileResponse(
-            os.path.join(os.path.dirname(__file__), "..", path), headers=headers
+    content_type = content_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    def open_download() -> Precompressed:
+        return Precompressed.open(
+            os.path.join(os.path.dirname(__file__), "..", path),
+            content_type=content_type,
         )
 
+    async def handler(request: aiohttp.web.Request) -> aiohttp.web.Response:
+        # Files are hashed and compressed on first use (unless the .br and .gz
+        # siblings were built in advance), off the event loop.
+        downloads: Dict[str, Precompressed] = request.app["downloads"]
+        download = downloads.get(path)
+        if download is None:
+            download_flights: SingleFlight[str, Precompressed] = request.app["download_flights"]
+            try:
+                download = downloads[path] = await download_flights.run(
+                    path, lambda: asyncio.to_thread(open_download)
+                )
+            except FileNotFoundError:
+                raise aiohttp.web.HTTPNotFound()
+        return download.response(request)
+
     return handler
 
 
@@ -57,6 +91,91 @@ def is_valid(board: chess.Board) -> bool:
     )
 
 
+def backend_headers(request: aiohttp.web.Request) -> Dict[str, str]:
+    # Lets the backend attribute and rate limit load per client. A coalesced
+    # request carries the identity of the client that started it, and a
+    # prefetch that of the client whose page view scheduled it.
+    return {
+        "Accept": "application/cbor",
+        "X-Forwarded-For": request.remote or "127.0.0.1",
+        "User-Agent": f"{request.headers.get('User-Agent', '-')} via syzygy-tables.info",
+    }
+
+
+async def fetch_probe(
+    app: aiohttp.web.Application, fen: str, headers: Dict[str, str]
+) -> ApiResponse:
+    backend: TablebaseBackend = app["backend"]
+    telemetry: Telemetry = app["telemetry"]
+    started = time.monotonic()
+    try:
+        probe, size = await backend.probe(fen, headers=headers)
+    except BackendError as err:
+        telemetry.backend("/", err.status, time.monotonic() - started)
+        raise
+    telemetry.backend("/", 200, time.monotonic() - started, size)
+
+    app["probe_cache"].put(fen, probe, size)
+    return probe
+
+
+def prefetch_used(app: aiohttp.web.Application, fen: str) -> None:
+    # Count prefetched positions as used, whichever cache serves them.
+    if app["prefetcher"] is not None:
+        app["prefetcher"].used(fen)
+
+
+async def query_probe(request: aiohttp.web.Request, fen: str) -> ApiResponse:
+    # Tablebase results for a position never change, so serve them from the
+    # cache if possible. Otherwise join a concurrent request for the same
+    # position, or start a new one.
+    probe_cache: LruCache[str, ApiResponse] = request.app["probe_cache"]
+    result = probe_cache.get(fen)
+    if result is not None:
+        prefetch_used(request.app, fen)
+        return result
+
+    probe_flights: SingleFlight[str, ApiResponse] = request.app["probe_flights"]
+    headers = backend_headers(request)
+    return await probe_flights.run(fen, lambda: fetch_probe(request.app, fen, headers))
+
+
+async def prefetch_probe(
+    app: aiohttp.web.Application, fen: str, headers: Dict[str, str]
+) -> bool:
+    if fen in app["probe_cache"]:
+        return False
+
+    probe_flights: SingleFlight[str, ApiResponse] = app["probe_flights"]
+    await probe_flights.run(fen, lambda: fetch_probe(app, fen, headers))
+    return True
+
+
+async def fetch_mainline(
+    app: aiohttp.web.Application, fen: str, headers: Dict[str, str]
+) -> Tuple[int, Dict[str, Any]]:
+    backend: TablebaseBackend = app["backend"]
+    telemetry: Telemetry = app["telemetry"]
+    started = time.monotonic()
+    try:
+        mainline, size = await backend.mainline(fen, headers=headers)
+    except BackendError as err:
+        telemetry.backend("/mainline", err.status, time.monotonic() - started)
+        return err.status, {
+            "dtz": None,
+            "mainline": [],
+        }
+    telemetry.backend("/mainline", 200, time.monotonic() - started, size)
+
+    return 200, mainline
+
+
+async def query_mainline(request: aiohttp.web.Request, fen: str) -> Tuple[int, Dict[str, Any]]:
+    mainline_flights: SingleFlight[str, Tuple[int, Dict[str, Any]]] = request.app["mainline_flights"]
+    headers = backend_headers(request)
+    return await mainline_flights.run(fen, lambda: fetch_mainline(request.app, fen, headers))
+
+
 @aiohttp.web.middleware
 async def trust_x_forwarded_for(
     request: aiohttp.web.Request,
@@ -69,24 +188,33 @@ async def trust_x_forwarded_for(
     return await handler(request)
 
 
+def set_cache_control(request: aiohttp.web.Request, response: aiohttp.web.StreamResponse) -> None:
+    # Keep explicit policies, and never cache server errors.
+    if not request.app["development"] and "Cache-Control" not in response.headers and response.status < 500:
+        cache_headers: Dict[str, str] = request.app["cache_headers"]
+        assets: syzygy_tables_info.assets.Manifest = request.app["assets"]
+        if assets.fingerprinted(request.path, request.query.get("v")):
+            response.headers["Cache-Control"] = cache_headers["asset"]
+        elif response.content_type == "text/html":
+            response.headers["Cache-Control"] = cache_headers["html"]
+        else:
+            response.headers["Cache-Control"] = cache_headers["default"]
+
+
 @aiohttp.web.middleware
 async def cache_control(
     request: aiohttp.web.Request,
     handler: Callable[[aiohttp.web.Request], Awaitable[aiohttp.web.StreamResponse]],
 ) -> aiohttp.web.StreamResponse:
     response = await handler(request)
-    if not request.app["development"]:
-        response.headers["Cache-Control"] = "public, max-age=86400"
+    set_cache_control(request, response)
     return response
 
 
-def prepare_stats(
-    request: aiohttp.web.Request,
-    material: str,
-    fen: str,
-    active_dtz: Optional[int],
-    precise_dtz: Optional[int],
-) -> Optional[RenderStats]:
+@functools.lru_cache(maxsize=8192)
+def prepare_endgame_stats(
+    material: str, side_winning: bool
+) -> Optional[Tuple[RenderStats, Dict[int, int]]]:
     render: RenderStats = {}
 
     # Get stats and side.
@@ -156,7 +284,6 @@ def prepare_stats(
     ]
 
     # Histogram.
-    side_winning = (" w" in fen) == (active_dtz is not None and active_dtz > 0)
     render["verb"] = "winning" if side_winning else "losing"
 
     win_hist = (
@@ -171,10 +298,14 @@ def prepare_stats(
     )
     hist = [a + b for a, b in itertools.zip_longest(win_hist, loss_hist, fillvalue=0)]
     if not any(hist):
-        return render
+        return render, {}
 
     maximum = max(math.log(num) if num else 0 for num in hist)
 
+    # Remember the row of each non-empty ply, so that the active row can
+    # later be marked without scanning the histogram.
+    rows: Dict[int, int] = {}
+
     render["histogram"] = []
     empty = 0
     for ply, num in enumerate(hist):
@@ -197,35 +328,305 @@ def prepare_stats(
                 )
         empty = 0
 
-        rounding = active_dtz != precise_dtz
+        rows[ply] = len(render["histogram"])
         render["histogram"].append(
             {
                 "ply": ply,
                 "num": num,
                 "width": int(round((math.log(num) if num else 0) * 100 / maximum, 1)),
-                "active": active_dtz is not None
-                and (
-                    abs(active_dtz) == ply
-                    or bool(rounding and active_dtz and abs(active_dtz) + 1 == ply)
-                ),
+                "active": False,
                 "empty": 0,
             }
         )
 
+    return render, rows
+
+
+def prepare_stats(
+    request: aiohttp.web.Request,
+    material: str,
+    fen: str,
+    active_dtz: Optional[int],
+    precise_dtz: Optional[int],
+) -> Optional[RenderStats]:
+    side_winning = (" w" in fen) == (active_dtz is not None and active_dtz > 0)
+    prepared = prepare_endgame_stats(material, side_winning)
+    if prepared is None:
+        return None
+
+    # The prepared stats are shared between requests. Copy only what is
+    # needed to mark the active rows.
+    cached, rows = prepared
+    if active_dtz is None or "histogram" not in cached:
+        return cached
+
+    active_plies = [abs(active_dtz)]
+    if active_dtz and active_dtz != precise_dtz:
+        active_plies.append(abs(active_dtz) + 1)
+
+    render = cached.copy()
+    render["histogram"] = cached["histogram"].copy()
+    for ply in active_plies:
+        if ply in rows:
+            row = render["histogram"][rows[ply]].copy()
+            row["active"] = True
+            render["histogram"][rows[ply]] = row
+
     return render
 
 
-def sort_key(endgame: str) -> Any:
-    w, b = endgame.split("v", 1)
-    return (
-        len(endgame),
-        len(w),
-        [-chess.syzygy.PCHR.index(p) for p in w],
-        len(b),
-        [-chess.syzygy.PCHR.index(p) for p in b],
+PAGES: Dict[str, Callable[..., Frag]] = {
+    "legal": syzygy_tables_info.views.legal,
+    "metrics": syzygy_tables_info.views.metrics,
+    "stats": syzygy_tables_info.views.stats,
+    "endgames": syzygy_tables_info.views.endgames,
+}
+
+
+def render_page(app: aiohttp.web.Application, name: str) -> Precompressed:
+    return Precompressed.compress(
+        PAGES[name](development=app["development"]).render().encode("utf-8"),
+        content_type="text/html",
+        charset="utf-8",
     )
 
 
+async def load_page(app: aiohttp.web.Application, name: str) -> Precompressed:
+    # Pages that do not depend on the request are rendered only once, on
+    # first use or during warmup. Rendering and compressing takes a while,
+    # so it happens off the event loop, shared by concurrent requests.
+    pages: Dict[str, Precompressed] = app["pages"]
+    precompressed = pages.get(name)
+    if precompressed is None:
+        page_flights: SingleFlight[str, Precompressed] = app["page_flights"]
+        precompressed = pages[name] = await page_flights.run(
+            name, lambda: asyncio.to_thread(render_page, app, name)
+        )
+    return precompressed
+
+
+async def page(request: aiohttp.web.Request, name: str) -> aiohttp.web.Response:
+    return (await load_page(request.app, name)).response(request)
+
+
+def batched(lines: Iterator[str], n: int) -> Iterator[List[str]]:
+    while batch := list(itertools.islice(lines, n)):
+        yield batch
+
+
+async def stream_lines(
+    request: aiohttp.web.Request, key: Tuple[Any, ...], lines: Iterator[str]
+) -> aiohttp.web.StreamResponse:
+    text_cache: LruCache[Tuple[Any, ...], bytes] = request.app["text_cache"]
+    body = text_cache.get(key)
+    if body is not None:
+        return aiohttp.web.Response(body=body, content_type="text/plain", charset="utf-8")
+
+    # Send lines in batches as they are generated, rather than building the
+    # entire response first. Keep a copy for the cache, unless it gets too
+    # large to be cached anyway.
+    response = aiohttp.web.StreamResponse()
+    response.content_type = "text/plain"
+    response.charset = "utf-8"
+    if request.version >= (1, 1):
+        response.enable_chunked_encoding()
+    # Headers are sent before the middleware sees the response.
+    set_cache_control(request, response)
+    await response.prepare(request)
+
+    chunks: Optional[List[bytes]] = []
+    size = 0
+    for batch in batched(lines, 256):
+        chunk = "".join(line + "\n" for line in batch).encode("utf-8")
+        await response.write(chunk)
+
+        size += len(chunk)
+        if chunks is not None and size <= text_cache.max_bytes:
+            chunks.append(chunk)
+        else:
+            chunks = None
+
+    await response.write_eof()
+
+    if chunks is not None:
+        text_cache.put(key, b"".join(chunks), size)
+    return response
+
+
+CATEGORY_WDL: Dict[str, int] = {
+    "loss": -2,
+    "maybe-loss": -2,
+    "blessed-loss": -1,
+    "draw": 0,
+    "cursed-win": 1,
+    "win": 2,
+    "maybe-win": 2,
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def compress_rank(rank: str) -> str:
+    # "..k....." -> "2k5"
+    result = []
+    empty = 0
+    for symbol in rank:
+        if symbol == ".":
+            empty += 1
+        else:
+            if empty:
+                result.append(str(empty))
+                empty = 0
+            result.append(symbol)
+    if empty:
+        result.append(str(empty))
+    return "".join(result)
+
+
+def child_fens(board: chess.Board, ucis: Iterable[str]) -> Iterator[str]:
+    # Pushing each move and generating the full FEN is expensive. Instead,
+    # patch the one or two affected ranks of the parent FEN. Moves involving
+    # castling rights or en passant are rare in endgames, and take the slow
+    # path.
+    slow = bool(board.castling_rights) or board.ep_square is not None
+    squares = ["."] * 64
+    for square, parent_piece in board.piece_map().items():
+        squares[square] = parent_piece.symbol()
+    ranks = ["".join(squares[rank * 8:rank * 8 + 8]) for rank in range(8)]
+    fen_ranks = [compress_rank(rank) for rank in reversed(ranks)]
+
+    pawn = "P" if board.turn == chess.WHITE else "p"
+    suffix = " b - - " if board.turn == chess.WHITE else " w - - "
+    fullmove = str(board.fullmove_number + (board.turn == chess.BLACK))
+    halfmove = str(board.halfmove_clock + 1)
+
+    for uci in ucis:
+        move = chess.Move.from_uci(uci)
+        from_square, to_square = move.from_square, move.to_square
+        piece = squares[from_square]
+        if slow or (piece == pawn and abs(to_square - from_square) == 16) or piece == ".":
+            board.push_uci(uci)
+            try:
+                yield board.fen()
+            finally:
+                board.pop()
+            continue
+
+        zeroing = piece == pawn or squares[to_square] != "."
+        if move.promotion:
+            piece = chess.piece_symbol(move.promotion)
+            if board.turn == chess.WHITE:
+                piece = piece.upper()
+
+        child = fen_ranks.copy()
+        from_rank, to_rank = from_square >> 3, to_square >> 3
+        if from_rank == to_rank:
+            rank = ranks[from_rank]
+            lo, hi = sorted([from_square & 7, to_square & 7])
+            middle = rank[lo + 1:hi]
+            if from_square < to_square:
+                rank = rank[:lo] + "." + middle + piece + rank[hi + 1:]
+            else:
+                rank = rank[:lo] + piece + middle + "." + rank[hi + 1:]
+            child[7 - from_rank] = compress_rank(rank)
+        else:
+            rank = ranks[from_rank]
+            child[7 - from_rank] = compress_rank(rank[:from_square & 7] + "." + rank[(from_square & 7) + 1:])
+            rank = ranks[to_rank]
+            child[7 - to_rank] = compress_rank(rank[:to_square & 7] + piece + rank[(to_square & 7) + 1:])
+
+        yield "/".join(child) + suffix + ("0" if zeroing else halfmove) + " " + fullmove
+
+
+def group_moves(board: chess.Board, moves: List[ApiMove]) -> Dict[Optional[int], List[RenderMove]]:
+    grouped_moves: Dict[Optional[int], List[RenderMove]] = {
+        -2: [],
+        -1: [],
+        0: [],
+        1: [],
+        2: [],
+        None: [],
+    }
+
+    for move_info, fen in zip(moves, child_fens(board, (move_info["uci"] for move_info in moves))):
+        move_dtz = move_info.get("dtz")
+        if move_info.get("checkmate"):
+            badge = "Checkmate"
+        elif move_info.get("stalemate"):
+            badge = "Stalemate"
+        elif move_info.get("insufficient_material"):
+            badge = "Insufficient material"
+        elif move_dtz is None:
+            badge = "Unknown"
+        elif move_dtz == 0:
+            badge = "Draw"
+        elif move_info.get("zeroing"):
+            badge = "Zeroing"
+        elif move_dtz < 0:
+            badge = "Win with DTZ %d" % (abs(move_dtz),)
+        else:
+            badge = "Loss with DTZ %d" % (move_dtz,)
+
+        wdl = CATEGORY_WDL.get(move_info["category"])
+        dtm = abs(move_info["dtm"]) if move_info.get("dtm") is not None else None
+
+        grouped_moves[wdl].append(
+            {
+                "uci": move_info["uci"],
+                "san": move_info["san"],
+                "fen": fen,
+                "wdl": wdl,
+                "dtz": move_dtz,
+                "dtm": dtm,
+                "zeroing": move_info["zeroing"],
+                "capture": "x" in move_info["san"],
+                "checkmate": move_info["checkmate"],
+                "stalemate": move_info["stalemate"],
+                "insufficient_material": move_info["insufficient_material"],
+                "badge": badge,
+            }
+        )
+
+    # Each group is sorted once, with keys from most to least significant.
+    # Missing DTZ sorts before the longest DTZ, missing DTM after.
+    def dtz_desc(move: RenderMove) -> Tuple[bool, int]:
+        dtz = move["dtz"]
+        return (dtz is not None, -dtz if dtz is not None else 0)
+
+    def dtm_asc(move: RenderMove) -> Tuple[bool, int]:
+        dtm = move["dtm"]
+        return (dtm is None, dtm if dtm is not None else 0)
+
+    def dtm_desc(move: RenderMove) -> Tuple[bool, int]:
+        dtm = move["dtm"]
+        return (dtm is None, -dtm if dtm is not None else 0)
+
+    # Winning moves.
+    grouped_moves[-2].sort(key=lambda move: (
+        not move["checkmate"], not move["capture"], not move["zeroing"], dtz_desc(move), dtm_asc(move), move["uci"]
+    ))
+
+    # Unknown moves.
+    grouped_moves[None].sort(key=lambda move: (not move["capture"], not move["zeroing"], move["uci"]))
+
+    # Moves leading to cursed wins.
+    grouped_moves[-1].sort(key=lambda move: (
+        not move["capture"], not move["zeroing"], dtz_desc(move), dtm_asc(move), move["uci"]
+    ))
+
+    # Drawing moves.
+    grouped_moves[0].sort(key=lambda move: (
+        not move["stalemate"], not move["insufficient_material"], not move["capture"], not move["zeroing"], move["uci"]
+    ))
+
+    # Moves leading to a blessed loss, and losing moves.
+    for wdl in [1, 2]:
+        grouped_moves[wdl].sort(key=lambda move: (
+            move["capture"], move["zeroing"], dtz_desc(move), dtm_desc(move), move["uci"]
+        ))
+
+    return grouped_moves
+
+
 routes = aiohttp.web.RouteTableDef()
 
 
@@ -257,81 +658,96 @@ async def syzygy_vs_syzygy_pgn(
     # Force reverse proxies like nginx to send the first chunk.
     await response.write('[Event ""]\n'.encode("utf-8"))
 
-    # Prepare PGN headers.
-    game = chess.pgn.Game()
-    game.setup(board)
-    del game.headers["Event"]
-    game.headers["Site"] = (
-        request.app["config"].get("server", "base_url")
-        + "?fen="
-        + board.fen().replace(" ", "_")
-    )
-    game.headers["Date"] = datetime.datetime.now().strftime("%Y.%m.%d")
-    game.headers["Round"] = "-"
-    game.headers["White"] = "Syzygy"
-    game.headers["Black"] = "Syzygy"
-    game.headers["Annotator"] = request.app["config"].get("server", "name")
-
     # Query backend.
-    async with request.app["session"].get(
-        request.app["config"].get("server", "backend") + "/mainline",
-        headers={
-            "Accept": "application/cbor",
-            "X-Forwarded-For": request.remote,
-            "User-Agent": f"{request.headers.get('User-Agent', '-')} via syzygy-tables.info",
-        },
-        params={"fen": board.fen()},
-    ) as res:
-        if res.status != 200:
-            result: Dict[str, Any] = {
-                "dtz": None,
-                "mainline": [],
-            }
-        else:
-            result = cbor2.loads(await res.read())
+    status, result = await query_mainline(request, board.fen())
+    mainline = result["mainline"]
+    dtz = mainline[-1]["dtz"] if mainline else result["dtz"]
+
+    # Result.
+    game_result = "*"
+    if dtz is not None:
+        if result["winner"] is None:
+            game_result = "1/2-1/2"
+        elif result["winner"].startswith("w"):
+            game_result = "1-0"
+        elif result["winner"].startswith("b"):
+            game_result = "0-1"
+
+    # PGN headers, in the order of the seven tag roster.
+    headers = [
+        (
+            "Site",
+            request.app["config"].get("server", "base_url")
+            + "?fen="
+            + board.fen().replace(" ", "_"),
+        ),
+        ("Date", datetime.datetime.now().strftime("%Y.%m.%d")),
+        ("Round", "-"),
+        ("White", "Syzygy"),
+        ("Black", "Syzygy"),
+        ("Result", game_result),
+    ]
+    if board.fen() != chess.STARTING_FEN:
+        headers.append(("FEN", board.fen()))
+        headers.append(("SetUp", "1"))
+    headers.append(("Annotator", request.app["config"].get("server", "name")))
+    await response.write(
+        "".join(f'[{name} "{value}"]\n' for name, value in headers).encode("utf-8") + b"\n"
+    )
 
     # Starting comment.
     if result["dtz"] == 0:
-        game.comment = "Tablebase draw"
+        comment: Optional[str] = "Tablebase draw"
     elif result["dtz"] is not None:
-        game.comment = "DTZ %d" % (result["dtz"],)
+        comment = "DTZ %d" % (result["dtz"],)
     else:
-        game.comment = "Position not in tablebases"
-
-    # Follow the DTZ mainline.
-    dtz = result["dtz"]
-    node: chess.pgn.GameNode = game
-    for move_info in result["mainline"]:
-        move = board.push_uci(move_info["uci"])
-        node = node.add_variation(move)
-        dtz = move_info["dtz"]
-
+        comment = "Position not in tablebases"
+
+    # Follow the DTZ mainline, writing movetext as moves are validated,
+    # rather than building a game tree first. Each comment is held back
+    # until the next move, because the final comment replaces it.
+    tokens: List[str] = []
+    force_movenumber = True
+    for ply, move_info in enumerate(mainline):
+        if comment:
+            tokens.append("{ " + comment + " } ")
+            force_movenumber = True
+
+        move = board.parse_uci(move_info["uci"])
+        if board.turn == chess.WHITE:
+            tokens.append(f"{board.fullmove_number}. ")
+        elif force_movenumber:
+            tokens.append(f"{board.fullmove_number}... ")
+        tokens.append(board.san(move) + " ")
+        board.push(move)
+        force_movenumber = False
+
+        comment = None
         if board.halfmove_clock == 0:
-            node.comment = "%s with DTZ %d" % (chess.syzygy.calc_key(board), dtz)
+            comment = "%s with DTZ %d" % (chess.syzygy.calc_key(board), move_info["dtz"])
+
+        if ply % 64 == 63:
+            await response.write("".join(tokens).encode("utf-8"))
+            tokens.clear()
 
     # Final comment.
-    if res.status not in [200, 404]:
-        node.comment = f"Unexpected internal status code {res.status}"
+    if status not in [200, 404]:
+        comment = f"Unexpected internal status code {status}"
     elif board.is_checkmate():
-        node.comment = "Checkmate"
+        comment = "Checkmate"
     elif board.is_stalemate():
-        node.comment = "Stalemate"
+        comment = "Stalemate"
     elif board.is_insufficient_material():
-        node.comment = "Insufficient material"
+        comment = "Insufficient material"
     elif dtz is not None and dtz != 0 and result["winner"] is None:
-        node.comment = "Draw claimed at DTZ %d" % (dtz,)
+        comment = "Draw claimed at DTZ %d" % (dtz,)
 
-    # Set result.
-    if dtz is not None:
-        if result["winner"] is None:
-            game.headers["Result"] = "1/2-1/2"
-        elif result["winner"].startswith("w"):
-            game.headers["Result"] = "1-0"
-        elif result["winner"].startswith("b"):
-            game.headers["Result"] = "0-1"
+    if comment:
+        tokens.append("{ " + comment + " } ")
+    tokens.append(game_result)
 
     # Send response.
-    await response.write(str(game).encode("utf-8"))
+    await response.write("".join(tokens).encode("utf-8"))
     return response
 
 
@@ -347,6 +763,23 @@ async def index(request: aiohttp.web.Request) -> aiohttp.web.Response:
     except ValueError:
         board = chess.Board(DEFAULT_FEN)
 
+    # The rendered page is a function of the position alone (tablebase
+    # results never change), so serve repeated views without probing or
+    # rendering. Note that cached views do not trigger prefetching.
+    page_key = (
+        board.board_fen(),
+        board.turn,
+        board.castling_rights,
+        board.ep_square,
+        "xhr" in request.query,
+        request.app["development"],
+    )
+    page_cache: LruCache[Tuple[Any, ...], Precompressed] = request.app["page_cache"]
+    cached_page = page_cache.get(page_key)
+    if cached_page is not None:
+        prefetch_used(request.app, board.fen())
+        return cached_page.response(request)
+
     # Get FENs with the current side to move, black and white to move.
     render["fen"] = board.fen()
     render["white_fen"] = with_turn(board, chess.WHITE).fen()
@@ -412,24 +845,10 @@ async def index(request: aiohttp.web.Request) -> aiohttp.web.Response:
             render["winning_side"] = "white"
     else:
         # Query backend.
-        async with request.app["session"].get(
-            request.app["config"].get("server", "backend"),
-            headers={
-                "Accept": "application/cbor",
-                "X-Forwarded-For": request.remote,
-                "User-Agent": f"{request.headers.get('User-Agent', '-')} via syzygy-tables.info",
-            },
-            params={"fen": board.fen()},
-        ) as res:
-            if res.status != 200:
-                return aiohttp.web.Response(
-                    status=res.status,
-                    content_type=res.content_type,
-                    body=await res.read(),
-                    charset=res.charset,
-                )
-
-            probe: ApiResponse = cbor2.loads(await res.read())
+        try:
+            probe = await query_probe(request, render["fen"])
+        except BackendError as err:
+            return err.response()
 
         dtz = probe.get("dtz")
         active_dtz = dtz or None
@@ -463,120 +882,35 @@ async def index(request: aiohttp.web.Request) -> aiohttp.web.Response:
 
         render["frustrated"] = probe["category"] in ["blessed-loss", "cursed-win"]
 
-        # Label and group all legal moves.
-        for move_info in probe["moves"]:
-            if move_info.get("checkmate"):
-                badge = "Checkmate"
-            elif move_info.get("stalemate"):
-                badge = "Stalemate"
-            elif move_info.get("insufficient_material"):
-                badge = "Insufficient material"
-            elif move_info.get("dtz") is None:
-                badge = "Unknown"
-            elif move_info["dtz"] == 0:
-                badge = "Draw"
-            elif move_info.get("zeroing"):
-                badge = "Zeroing"
-            elif move_info["dtz"] < 0:
-                badge = "Win with DTZ %d" % (abs(move_info["dtz"]),)
-            else:
-                badge = "Loss with DTZ %d" % (move_info["dtz"],)
-
-            if move_info["category"] in ["loss", "maybe-loss"]:
-                wdl: Optional[int] = -2
-            elif move_info["category"] == "blessed-loss":
-                wdl = -1
-            elif move_info["category"] == "draw":
-                wdl = 0
-            elif move_info["category"] == "cursed-win":
-                wdl = 1
-            elif move_info["category"] in ["win", "maybe-win"]:
-                wdl = 2
-            else:
-                wdl = None
-
-            dtm = abs(move_info["dtm"]) if move_info.get("dtm") is not None else None
+        # Label, group and sort all legal moves.
+        grouped_moves = group_moves(board, probe["moves"])
 
-            try:
-                board.push_uci(move_info["uci"])
-                grouped_moves[wdl].append(
-                    {
-                        "uci": move_info["uci"],
-                        "san": move_info["san"],
-                        "fen": board.fen(),
-                        "wdl": wdl,
-                        "dtz": move_info.get("dtz"),
-                        "dtm": dtm,
-                        "zeroing": move_info["zeroing"],
-                        "capture": "x" in move_info["san"],
-                        "checkmate": move_info["checkmate"],
-                        "stalemate": move_info["stalemate"],
-                        "insufficient_material": move_info["insufficient_material"],
-                        "badge": badge,
-                    }
-                )
-            finally:
-                board.pop()
-
-    # Sort winning moves.
-    grouped_moves[-2].sort(key=lambda move: move["uci"])
-    grouped_moves[-2].sort(key=lambda move: (move["dtm"] is None, move["dtm"]))
-    grouped_moves[-2].sort(
-        key=lambda move: (move["dtz"] is None, move["dtz"]), reverse=True
-    )
-    grouped_moves[-2].sort(key=lambda move: move["zeroing"], reverse=True)
-    grouped_moves[-2].sort(key=lambda move: move["capture"], reverse=True)
-    grouped_moves[-2].sort(key=lambda move: move["checkmate"], reverse=True)
     render["winning_moves"] = grouped_moves[-2]
-
-    # Sort unknown moves.
-    grouped_moves[None].sort(key=lambda move: move["uci"])
-    grouped_moves[None].sort(key=lambda move: move["zeroing"], reverse=True)
-    grouped_moves[None].sort(key=lambda move: move["capture"], reverse=True)
     render["unknown_moves"] = grouped_moves[None]
-
-    # Sort moves leading to cursed wins.
-    grouped_moves[-1].sort(key=lambda move: move["uci"])
-    grouped_moves[-1].sort(key=lambda move: (move["dtm"] is None, move["dtm"]))
-    grouped_moves[-1].sort(
-        key=lambda move: (move["dtz"] is None, move["dtz"]), reverse=True
-    )
-    grouped_moves[-1].sort(key=lambda move: move["zeroing"], reverse=True)
-    grouped_moves[-1].sort(key=lambda move: move["capture"], reverse=True)
     render["cursed_moves"] = grouped_moves[-1]
-
-    # Sort drawing moves.
-    grouped_moves[0].sort(key=lambda move: move["uci"])
-    grouped_moves[0].sort(key=lambda move: move["zeroing"], reverse=True)
-    grouped_moves[0].sort(key=lambda move: move["capture"], reverse=True)
-    grouped_moves[0].sort(key=lambda move: move["insufficient_material"], reverse=True)
-    grouped_moves[0].sort(key=lambda move: move["stalemate"], reverse=True)
     render["drawing_moves"] = grouped_moves[0]
-
-    # Sort moves leading to a blessed loss.
-    grouped_moves[1].sort(key=lambda move: move["uci"])
-    grouped_moves[1].sort(
-        key=lambda move: (move["dtm"] is not None, move["dtm"]), reverse=True
-    )
-    grouped_moves[1].sort(
-        key=lambda move: (move["dtz"] is None, move["dtz"]), reverse=True
-    )
-    grouped_moves[1].sort(key=lambda move: move["zeroing"])
-    grouped_moves[1].sort(key=lambda move: move["capture"])
     render["blessed_moves"] = grouped_moves[1]
-
-    # Sort losing moves.
-    grouped_moves[2].sort(key=lambda move: move["uci"])
-    grouped_moves[2].sort(
-        key=lambda move: (move["dtm"] is not None, move["dtm"]), reverse=True
-    )
-    grouped_moves[2].sort(
-        key=lambda move: (move["dtz"] is None, move["dtz"]), reverse=True
-    )
-    grouped_moves[2].sort(key=lambda move: move["zeroing"])
-    grouped_moves[1].sort(key=lambda move: move["capture"])
     render["losing_moves"] = grouped_moves[2]
 
+    # Warm the cache for the moves the user is most likely to play next.
+    if request.app["prefetcher"] is not None and not render["illegal"]:
+        request.app["prefetcher"].schedule(
+            request.remote or "127.0.0.1",
+            (
+                " ".join(move["fen"].split(" ")[:4]) + " 0 1"
+                for moves in [
+                    render["winning_moves"],
+                    render["cursed_moves"],
+                    render["drawing_moves"],
+                    render["blessed_moves"],
+                    render["losing_moves"],
+                ]
+                for move in moves
+                if not move["checkmate"] and not move["stalemate"]
+            ),
+            backend_headers(request),
+        )
+
     # Stats.
     render["stats"] = prepare_stats(
         request, material, render["fen"], active_dtz, precise_dtz
@@ -602,27 +936,133 @@ async def index(request: aiohttp.web.Request) -> aiohttp.web.Response:
             development=request.app["development"], render=render
         ).render()
 
-    return aiohttp.web.Response(text=html, content_type="text/html")
+    page = Precompressed.compress(
+        html.encode("utf-8"),
+        content_type="text/html",
+        charset="utf-8",
+        brotli_quality=request.app["config"].getint("cache", "page_brotli_quality"),
+    )
+    page_cache.put(page_key, page, page.size)
+    return page.response(request)
+
+
+def parse_position(line: str) -> chess.Board:
+    # FEN with optional underscores as in URLs, or EPD with operations.
+    line = line.strip().replace("_", " ")
+    try:
+        board = chess.Board(line)
+    except ValueError:
+        board, _ = chess.Board.from_epd(line)
+    board.halfmove_clock = 0
+    board.fullmove_number = 1
+    return board
+
+
+async def batch_inputs(request: aiohttp.web.Request) -> List[str]:
+    if request.content_type == "application/json":
+        inputs = await request.json()
+    elif request.content_type == "application/cbor":
+        inputs = cbor2.loads(await request.read())
+    else:
+        return [line for line in (await request.text()).splitlines() if line.strip()]
+
+    if not isinstance(inputs, list) or not all(isinstance(fen, str) for fen in inputs):
+        raise aiohttp.web.HTTPBadRequest(reason="expected list of fens")
+    return inputs
+
+
+@routes.post("/batch")
+async def batch(request: aiohttp.web.Request) -> aiohttp.web.StreamResponse:
+    try:
+        inputs = await batch_inputs(request)
+    except ValueError:
+        raise aiohttp.web.HTTPBadRequest(reason="invalid request body")
+
+    config = request.app["config"]
+    if len(inputs) > config.getint("batch", "max_positions"):
+        raise aiohttp.web.HTTPRequestEntityTooLarge(
+            max_size=config.getint("batch", "max_positions"), actual_size=len(inputs)
+        )
+
+    # Validate and deduplicate by canonical FEN.
+    errors: List[BatchResult] = []
+    positions: Dict[str, List[int]] = {}
+    for index, line in enumerate(inputs):
+        try:
+            board = parse_position(line)
+        except ValueError:
+            errors.append({"index": [index], "input": line, "error": "invalid fen"})
+            continue
+        if not is_valid(board):
+            errors.append({"index": [index], "input": line, "error": "illegal position"})
+            continue
+        positions.setdefault(board.fen(), []).append(index)
+
+    cbor = "application/cbor" in request.headers.get("Accept", "")
+
+    def encode(result: BatchResult) -> bytes:
+        return cbor2.dumps(result) if cbor else json.dumps(result).encode("utf-8") + b"\n"
+
+    probe_cache: LruCache[str, ApiResponse] = request.app["probe_cache"]
+    hits: List[BatchResult] = []
+    misses = []
+    for fen, indexes in positions.items():
+        probe = probe_cache.get(fen)
+        if probe is None:
+            misses.append(fen)
+        else:
+            prefetch_used(request.app, fen)
+            hits.append({"index": indexes, "fen": fen, "probe": probe})
+
+    # Each position that needs a backend probe counts as a request against
+    # the client's rate limit.
+    admission: AdmissionControl = request.app["admission"]
+    admission.charge(request, max(1, len(misses)))
+
+    response = aiohttp.web.StreamResponse()
+    response.content_type = "application/cbor-seq" if cbor else "application/x-ndjson"
+    response.headers["Cache-Control"] = "no-store"
+    await response.prepare(request)
+
+    # Results are streamed as soon as they are available, cached ones first.
+    for result in itertools.chain(errors, hits):
+        await response.write(encode(result))
+
+    async def probe_one(fen: str) -> BatchResult:
+        try:
+            return {"index": positions[fen], "fen": fen, "probe": await query_probe(request, fen)}
+        except BackendError as err:
+            return {"index": positions[fen], "fen": fen, "error": f"backend responded with status {err.status}"}
+
+    # Fan out with a bounded window of concurrent backend requests.
+    window = config.getint("batch", "concurrency")
+    pending: Set["asyncio.Task[BatchResult]"] = set()
+    queue = iter(misses)
+    try:
+        for fen in itertools.islice(queue, window):
+            pending.add(asyncio.create_task(probe_one(fen)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                await response.write(encode(task.result()))
+                for fen in itertools.islice(queue, 1):
+                    pending.add(asyncio.create_task(probe_one(fen)))
+    finally:
+        for task in pending:
+            task.cancel()
+
+    await response.write_eof()
+    return response
 
 
 @routes.get("/legal")
 async def legal(request: aiohttp.web.Request) -> aiohttp.web.Response:
-    return aiohttp.web.Response(
-        text=syzygy_tables_info.views.legal(
-            development=request.app["development"]
-        ).render(),
-        content_type="text/html",
-    )
+    return await page(request, "legal")
 
 
 @routes.get("/metrics")
 async def metrics(request: aiohttp.web.Request) -> aiohttp.web.Response:
-    return aiohttp.web.Response(
-        text=syzygy_tables_info.views.metrics(
-            development=request.app["development"]
-        ).render(),
-        content_type="text/html",
-    )
+    return await page(request, "metrics")
 
 
 @routes.get("/robots.txt")
@@ -654,12 +1094,7 @@ async def sitemap(request: aiohttp.web.Request) -> aiohttp.web.Response:
 
 @routes.get("/stats")
 async def stats_doc(request: aiohttp.web.Request) -> aiohttp.web.Response:
-    return aiohttp.web.Response(
-        text=syzygy_tables_info.views.stats(
-            development=request.app["development"]
-        ).render(),
-        content_type="text/html",
-    )
+    return await page(request, "stats")
 
 
 @routes.get("/stats/{material}.json")
@@ -675,144 +1110,250 @@ async def stats_json(request: aiohttp.web.Request) -> aiohttp.web.Response:
         )
 
     try:
-        stats = syzygy_tables_info.stats.STATS[table]
+        body = stats_json_body(table)
     except KeyError:
         raise aiohttp.web.HTTPNotFound()
     else:
-        return aiohttp.web.json_response(stats)
+        return aiohttp.web.Response(body=body, content_type="application/json")
 
 
-@routes.get("/graph.dot")
-@routes.get("/graph/{material}.dot")
-async def graph_dot(request: aiohttp.web.Request) -> aiohttp.web.Response:
-    root = request.match_info.get("material", "KPPPPPvK,KPPPPvKP,KPPPvKPP").split(",")
-    if not all(chess.syzygy.is_tablename(r) for r in root):
-        raise aiohttp.web.HTTPNotFound()
+@functools.lru_cache(maxsize=2048)
+def stats_json_body(material: str) -> bytes:
+    return json.dumps(syzygy_tables_info.stats.STATS[material]).encode("utf-8")
 
-    closed = set(["KvK"])
-    target = root[:]
 
-    result = []
-    result.append("digraph Syzygy {")
-    while target:
-        material = target.pop()
-        if material in closed:
-            continue
+DOWNLOAD_SOURCES = {
+    "lichess": "lichess",
+    "lichess.org": "lichess",
+    "lichess.ovh": "lichess",
+    "tablebase.lichess.ovh": "lichess",
+    "sesse": "sesse",
+    "sesse.net": "sesse",
+    "tablebase.sesse.net": "sesse",
+    "stem": "stem",
+    "material": "stem",
+    "file": "file",
+    "filename": "file",
+}
+
 
-        deps = list(chess.syzygy.dependencies(material))
-        target.extend(deps)
+def graph_dot_lines(root: List[str]) -> Iterator[str]:
+    yield "digraph Syzygy {"
+    for material, deps in graph().edges(root):
         if not deps and material in root:
-            result.append("  {};".format(material))
+            yield "  {};".format(material)
         for dep in deps:
-            result.append("  {} -> {};".format(material, dep))
+            yield "  {} -> {};".format(material, dep)
+    yield "}"
 
-        closed.add(material)
-    result.append("}")
 
-    result.append("")
-    return aiohttp.web.Response(text="\n".join(result))
-
-
-@routes.get("/download.txt")
-@routes.get("/download/{material}.txt")
-async def download_txt(request: aiohttp.web.Request) -> aiohttp.web.Response:
+@routes.get("/graph.dot")
+@routes.get("/graph/{material}.dot")
+async def graph_dot(request: aiohttp.web.Request) -> aiohttp.web.StreamResponse:
     root = request.match_info.get("material", "KPPPPPvK,KPPPPvKP,KPPPvKPP").split(",")
     if not all(chess.syzygy.is_tablename(r) for r in root):
         raise aiohttp.web.HTTPNotFound()
 
-    source = request.query.get("source", "lichess")
-    dtz = request.query.get("dtz", "all")
+    return await stream_lines(request, ("graph", tuple(root)), graph_dot_lines(root))
 
-    try:
-        max_pieces = int(request.query.get("max-pieces", "7"))
-        min_pieces = int(request.query.get("min-pieces", "3"))
-    except ValueError:
-        raise aiohttp.web.HTTPBadRequest(reason="invalid piece count")
-
-    tables = list(chess.syzygy.all_dependencies(root))
-    tables.sort(key=sort_key)
 
-    result = []
-    for table in tables:
+def download_txt_lines(
+    root: FrozenSet[str], source: str, dtz: str, min_pieces: int, max_pieces: int
+) -> Iterator[str]:
+    for table in graph().closure(root):
         piece_count = len(table) - 1
         if piece_count > max_pieces or piece_count < min_pieces:
             continue
 
         include_dtz = dtz in ["all", "only"] or (dtz == "root" and table in root)
         include_wdl = dtz != "only"
-        if source in ["lichess", "lichess.org", "lichess.ovh", "tablebase.lichess.ovh"]:
+        if source == "lichess":
             base = "https://tablebase.lichess.ovh/tables/standard"
             if len(table) <= 6:
                 if include_wdl:
-                    result.append("{}/3-4-5-wdl/{}.rtbw".format(base, table))
+                    yield "{}/3-4-5-wdl/{}.rtbw".format(base, table)
                 if include_dtz:
-                    result.append("{}/3-4-5-dtz/{}.rtbz".format(base, table))
+                    yield "{}/3-4-5-dtz/{}.rtbz".format(base, table)
             elif len(table) <= 7:
                 if include_wdl:
-                    result.append("{}/6-wdl/{}.rtbw".format(base, table))
+                    yield "{}/6-wdl/{}.rtbw".format(base, table)
                 if include_dtz:
-                    result.append("{}/6-dtz/{}.rtbz".format(base, table))
+                    yield "{}/6-dtz/{}.rtbz".format(base, table)
             else:
                 suffix = "pawnful" if "P" in table else "pawnless"
                 w, b = table.split("v")
                 if include_wdl:
-                    result.append(
+                    yield (
                         "{}/7/{}v{}_{}/{}.rtbw".format(
                             base, len(w), len(b), suffix, table
                         )
                     )
                 if include_dtz:
-                    result.append(
+                    yield (
                         "{}/7/{}v{}_{}/{}.rtbz".format(
                             base, len(w), len(b), suffix, table
                         )
                     )
-        elif source in ["sesse", "sesse.net", "tablebase.sesse.net"]:
+        elif source == "sesse":
             base = "http://tablebase.sesse.net/syzygy"
             if len(table) <= 6:
                 if include_wdl:
-                    result.append("{}/3-4-5/{}.rtbw".format(base, table))
+                    yield "{}/3-4-5/{}.rtbw".format(base, table)
                 if include_dtz:
-                    result.append("{}/3-4-5/{}.rtbz".format(base, table))
+                    yield "{}/3-4-5/{}.rtbz".format(base, table)
             elif len(table) <= 7:
                 if include_wdl:
-                    result.append("{}/6-WDL/{}.rtbw".format(base, table))
+                    yield "{}/6-WDL/{}.rtbw".format(base, table)
                 if include_dtz:
-                    result.append("{}/6-DTZ/{}.rtbz".format(base, table))
+                    yield "{}/6-DTZ/{}.rtbz".format(base, table)
             else:
                 if include_wdl:
-                    result.append("{}/7-WDL/{}.rtbw".format(base, table))
+                    yield "{}/7-WDL/{}.rtbw".format(base, table)
                 if include_dtz:
-                    result.append("{}/7-DTZ/{}.rtbz".format(base, table))
-        elif source in ["stem", "material"]:
-            result.append(table)
-        elif source in ["file", "filename"]:
+                    yield "{}/7-DTZ/{}.rtbz".format(base, table)
+        elif source == "stem":
+            yield table
+        elif source == "file":
             if include_wdl:
-                result.append("{}.rtbw".format(table))
+                yield "{}.rtbw".format(table)
             if include_dtz:
-                result.append("{}.rtbz".format(table))
-        else:
-            raise aiohttp.web.HTTPBadRequest(reason="unknown source")
+                yield "{}.rtbz".format(table)
+
+
+@routes.get("/download.txt")
+@routes.get("/download/{material}.txt")
+async def download_txt(request: aiohttp.web.Request) -> aiohttp.web.StreamResponse:
+    root = request.match_info.get("material", "KPPPPPvK,KPPPPvKP,KPPPvKPP").split(",")
+    if not all(chess.syzygy.is_tablename(r) for r in root):
+        raise aiohttp.web.HTTPNotFound()
 
-    result.append("")
-    return aiohttp.web.Response(text="\n".join(result))
+    try:
+        source = DOWNLOAD_SOURCES[request.query.get("source", "lichess")]
+    except KeyError:
+        raise aiohttp.web.HTTPBadRequest(reason="unknown source")
+
+    dtz = request.query.get("dtz", "all")
+    if dtz not in ["all", "only", "root"]:
+        dtz = "none"
+
+    try:
+        max_pieces = int(request.query.get("max-pieces", "7"))
+        min_pieces = int(request.query.get("min-pieces", "3"))
+    except ValueError:
+        raise aiohttp.web.HTTPBadRequest(reason="invalid piece count")
+
+    return await stream_lines(
+        request,
+        ("download", frozenset(root), source, dtz, min_pieces, max_pieces),
+        download_txt_lines(frozenset(root), source, dtz, min_pieces, max_pieces),
+    )
 
 
 @routes.get("/endgames")
 async def endgames(request: aiohttp.web.Request) -> aiohttp.web.Response:
-    return aiohttp.web.Response(
-        text=syzygy_tables_info.views.endgames(
-            development=request.app["development"]
-        ).render(),
-        content_type="text/html",
-    )
+    return await page(request, "endgames")
+
+
+async def warmup(app: aiohttp.web.Application) -> AsyncIterator[None]:
+    # Prepare what early requests would otherwise wait for, in the
+    # background, so that startup is not delayed.
+    async def run() -> None:
+        await asyncio.to_thread(lambda: syzygy_tables_info.stats.STATS)
+        for name in PAGES:
+            await load_page(app, name)
+        await asyncio.to_thread(graph)
+
+    task = asyncio.create_task(run())
+    yield
+    task.cancel()
 
 
 async def make_app(config: configparser.ConfigParser) -> aiohttp.web.Application:
-    app = aiohttp.web.Application(middlewares=[trust_x_forwarded_for, cache_control])
-    app["session"] = aiohttp.ClientSession()
+    telemetry = Telemetry()
+    admission = AdmissionControl(
+        routes={"/", "/syzygy-vs-syzygy/{material}.pgn", "/batch"},
+        metered={"/batch"},
+        rate=config.getfloat("limits", "rate"),
+        burst=config.getfloat("limits", "burst"),
+        max_clients=config.getint("limits", "clients"),
+        concurrency=config.getint("limits", "concurrency"),
+        queue=config.getint("limits", "queue"),
+        queue_timeout=config.getfloat("limits", "queue_timeout"),
+    )
+    app = aiohttp.web.Application(
+        middlewares=[telemetry.middleware, trust_x_forwarded_for, admission.middleware, cache_control]
+    )
+    app["admission"] = admission
+    app["telemetry"] = telemetry
+    app.on_startup.append(telemetry.start)
+    app.on_cleanup.append(telemetry.stop)
     app["config"] = config
+    directories = config.get("local", "directories").split()
+    if directories:
+        app["backend"] = LocalBackend(directories, processes=config.getint("local", "processes"))
+    else:
+        app["backend"] = BackendPool(
+            config.get("server", "backend").split(),
+            limit=config.getint("backend", "limit"),
+            limit_per_host=config.getint("backend", "limit_per_host"),
+            keepalive=config.getfloat("backend", "keepalive"),
+            connect_timeout=config.getfloat("backend", "connect_timeout"),
+            timeout=config.getfloat("backend", "timeout"),
+            max_failures=config.getint("backend", "max_failures"),
+            ejection_time=config.getfloat("backend", "ejection_time"),
+            hedge_percentile=config.getfloat("backend", "hedge_percentile"),
+            hedge_min_delay=config.getfloat("backend", "hedge_min_delay"),
+            breaker=CircuitBreaker(
+                threshold=config.getfloat("backend", "breaker_threshold"),
+                window=config.getint("backend", "breaker_window"),
+                min_requests=config.getint("backend", "breaker_min_requests"),
+                cooldown=config.getfloat("backend", "breaker_cooldown"),
+            ),
+        )
+    app.on_cleanup.append(app["backend"].close)
     app["development"] = config.getboolean("server", "development")
+    app["assets"] = syzygy_tables_info.assets.manifest()
+    app["cache_headers"] = {
+        "asset": f"public, max-age={config.getint('cache', 'asset_max_age')}, immutable",
+        "html": f"public, max-age={config.getint('cache', 'html_max_age')}",
+        "default": f"public, max-age={config.getint('cache', 'max_age')}",
+    }
+    app["probe_cache"] = LruCache[str, ApiResponse](
+        max_entries=config.getint("cache", "probe_entries"),
+        max_bytes=config.getint("cache", "probe_bytes"),
+        ttl=config.getfloat("cache", "probe_ttl"),
+    )
+    app["probe_flights"] = SingleFlight[str, ApiResponse]()
+    app["mainline_flights"] = SingleFlight[str, Tuple[int, Dict[str, Any]]]()
+    app["pages"] = {}
+    app["page_flights"] = SingleFlight[str, Precompressed]()
+    if config.getboolean("server", "warmup"):
+        app.cleanup_ctx.append(warmup)
+    app["downloads"] = {}
+    app["text_cache"] = LruCache[Tuple[Any, ...], bytes](
+        max_entries=config.getint("cache", "text_entries"),
+        max_bytes=config.getint("cache", "text_bytes"),
+    )
+    app["download_flights"] = SingleFlight[str, Precompressed]()
+    app["page_cache"] = LruCache[Tuple[Any, ...], Precompressed](
+        max_entries=config.getint("cache", "page_entries"),
+        max_bytes=config.getint("cache", "page_bytes"),
+    )
+
+    # Optionally prefetch likely next positions.
+    app["prefetcher"] = None
+    if config.getboolean("prefetch", "enabled"):
+        app["prefetcher"] = Prefetcher(
+            functools.partial(prefetch_probe, app),
+            moves=config.getint("prefetch", "moves"),
+            concurrency=config.getint("prefetch", "concurrency"),
+            queue_size=config.getint("prefetch", "queue"),
+            rate=config.getfloat("prefetch", "rate"),
+            burst=config.getfloat("prefetch", "burst"),
+            max_clients=config.getint("prefetch", "clients"),
+        )
+        app.on_startup.append(app["prefetcher"].start)
+        app.on_cleanup.append(app["prefetcher"].stop)
 
     # Check configured base url.
     assert config.get("server", "base_url").startswith("http")
@@ -885,7 +1426,58 @@ async def make_app(config: configparser.ConfigParser) -> aiohttp.web.Application
     return app
 
 
+async def make_worker_app(
+    config: configparser.ConfigParser, worker: int, ready_fd: Optional[int]
+) -> aiohttp.web.Application:
+    app = await make_app(config)
+    app["worker"] = worker
+
+    async def notify_ready(app: aiohttp.web.Application) -> None:
+        # Tell the supervisor that this worker is ready to accept connections.
+        if ready_fd is not None:
+            os.write(ready_fd, b"r")
+            os.close(ready_fd)
+
+    app.on_startup.append(notify_ready)
+    return app
+
+
+async def profile_startup(config: configparser.ConfigParser) -> None:
+    import syzygy_tables_info.startup as startup
+
+    startup.stage("imports")
+    app = await make_app(config)
+    startup.stage("make_app")
+    runner = aiohttp.web.AppRunner(app, access_log=None)
+    await runner.setup()
+    startup.stage("startup hooks")
+    try:
+        # On a free port, so that it can run next to a live server.
+        site = aiohttp.web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        startup.stage("bind")
+
+        host, port = runner.addresses[0][:2]
+        async with aiohttp.ClientSession() as session:
+            for path in ["/legal", "/stats/KRvK.json", "/endgames", "/download.txt"]:
+                async with session.get(f"http://{host}:{port}{path}") as res:
+                    await res.read()
+                startup.stage(f"first GET {path} ({res.status})")
+    finally:
+        await runner.cleanup()
+
+    startup.report()
+
+
 def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="python -m syzygy_tables_info")
+    parser.add_argument("config", nargs="*", help="additional config files")
+    parser.add_argument("--fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ready-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--profile-startup", action="store_true", help="report import and initialization times, then exit")
+    args = parser.parse_args(argv)
+
     logging.basicConfig(level=logging.DEBUG)
 
     config = configparser.ConfigParser()
@@ -894,12 +1486,36 @@ def main(argv: List[str]) -> None:
             os.path.join(os.path.dirname(__file__), "..", "config.default.ini"),
             os.path.join(os.path.dirname(__file__), "..", "config.ini"),
         ]
-        + argv
+        + args.config
     )
 
     bind = config.get("server", "bind")
     port = config.getint("server", "port")
+    workers = config.getint("server", "workers")
+
+    if args.profile_startup:
+        asyncio.run(profile_startup(config))
+        return
+
+    if args.fd is not None:
+        # Worker process, serving on the socket inherited from the supervisor.
+        aiohttp.web.run_app(
+            make_worker_app(config, args.worker, args.ready_fd),
+            sock=socket.socket(fileno=args.fd),
+            access_log=None,
+            print=None,
+        )
+        return
 
     print("* Server name: ", config.get("server", "name"))
     print("* Base url: ", config.get("server", "base_url"))
-    aiohttp.web.run_app(make_app(config), host=bind, port=port, access_log=None)
+
+    if workers > 1:
+        import syzygy_tables_info.workers  # Only needed by the supervisor.
+
+        print(f"* Workers: {workers} (SIGHUP for rolling restart, SIGUSR1 for stats)")
+        sock = socket.create_server((bind, port), backlog=config.getint("server", "backlog"))
+        print(f"======== Running on http://{bind}:{port} ========")
+        syzygy_tables_info.workers.Supervisor(sock, args.config, workers=workers).run()
+    else:
+        aiohttp.web.run_app(make_app(config), host=bind, port=port, access_log=None)
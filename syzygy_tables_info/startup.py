@@ -0,0 +1,84 @@
+import importlib.abc
+import importlib.machinery
+import sys
+import time
+
+from types import ModuleType
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+class TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader: Any, name: str, timer: "ImportTimer") -> None:
+        self.loader = loader
+        self.name = name
+        self.timer = timer
+
+    def create_module(self, spec: importlib.machinery.ModuleSpec) -> Optional[ModuleType]:
+        module: Optional[ModuleType] = self.loader.create_module(spec)
+        return module
+
+    def exec_module(self, module: ModuleType) -> None:
+        self.timer.stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self.timer.stack.pop()
+            if self.timer.stack:
+                self.timer.stack[-1] += elapsed
+            self.timer.records.append((self.name, elapsed, elapsed - nested))
+
+    def __getattr__(self, name: str) -> Any:
+        # Resource readers and the like.
+        return getattr(self.loader, name)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    def __init__(self) -> None:
+        self.records: List[Tuple[str, float, float]] = []
+        self.stack: List[float] = []
+
+    def find_spec(
+        self, fullname: str, path: Optional[Sequence[str]], target: Optional[ModuleType] = None
+    ) -> Optional[importlib.machinery.ModuleSpec]:
+        # Find the module with the remaining finders, then time its loader.
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec: Optional[importlib.machinery.ModuleSpec] = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = TimedLoader(spec.loader, fullname, self)
+                return spec
+        return None
+
+
+timer: Optional[ImportTimer] = None
+stages: List[Tuple[str, float]] = []
+started = time.perf_counter()
+
+
+def install() -> None:
+    global timer
+    timer = ImportTimer()
+    sys.meta_path.insert(0, timer)
+
+
+def stage(name: str) -> None:
+    stages.append((name, time.perf_counter()))
+
+
+def report(top: int = 25) -> None:
+    print("Startup stages:")
+    last = started
+    for name, at in stages:
+        print(f"  {(at - last) * 1000:9.1f} ms  {name}")
+        last = at
+    print(f"  {(last - started) * 1000:9.1f} ms  total")
+
+    if timer is not None:
+        print()
+        print(f"Slowest of {len(timer.records)} imports (self, cumulative):")
+        for name, cumulative, self_time in sorted(timer.records, key=lambda record: record[2], reverse=True)[:top]:
+            print(f"  {self_time * 1000:9.1f} ms {cumulative * 1000:9.1f} ms  {name}")
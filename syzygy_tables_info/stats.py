@@ -1,7 +1,15 @@
+import functools
 import json
-import os.path
+import logging
+import mmap
+import os
+import struct
+import threading
 
-from typing import Dict, List, TypedDict
+from typing import Any, Dict, Iterator, List, Mapping, TypedDict, cast
+
+
+logger = logging.getLogger(__name__)
 
 
 TableStats = TypedDict("TableStats", {
@@ -41,13 +49,14 @@ class EndgameStats(TypedDict):
     histogram: Histograms
 
 
+@functools.lru_cache(maxsize=4096)
 def longest_fen(material: str) -> str:
     if material == "KNvK":
         return "4k3/8/8/8/8/8/8/1N2K3 w - - 0_1"
     elif material == "KBvK":
         return "4k3/8/8/8/8/8/8/2B1K3 w - - 0 1"
     else:
-        stats = STATS[material]
+        stats = load()[material]
         longest = max(stats["longest"], key=lambda e: e["ply"])
         return longest["epd"] + " 0 1"
 
@@ -56,5 +65,203 @@ def is_maximal(material: str) -> bool:
     return material in ["KRvK", "KBNvK", "KNNvKP", "KRNvKNN", "KRBNvKQN"]
 
 
-with open(os.path.join(os.path.dirname(__file__), "..", "stats.json")) as f:
-    STATS: Dict[str, EndgameStats] = json.load(f)
+STATS_JSON = os.path.join(os.path.dirname(__file__), "..", "stats.json")
+
+STATS_BIN = os.path.join(os.path.dirname(__file__), "..", "stats.bin")
+
+
+# Binary layout of stats.bin (little endian):
+#
+# * Header: magic, number of endgames.
+# * Entry table, sorted by material key for binary search: material key
+#   (padded with NUL), record offset, record length.
+# * Order table: entry indexes in the original order of stats.json.
+# * Records: WDL counts for white and black, lengths of the win and loss
+#   histograms for white and black, the packed histograms, and finally
+#   the remaining fields (checksums, longest endgames) as JSON.
+MAGIC = b"SYZSTAT1"
+KEY_SIZE = 8
+HEADER = struct.Struct("<8sI")
+ENTRY = struct.Struct("<8sII")
+ORDER = struct.Struct("<H")
+WDL = struct.Struct("<10q")
+LENGTHS = struct.Struct("<4H")
+BLOB = struct.Struct("<I")
+
+WDL_KEYS = ["-2", "-1", "0", "1", "2"]
+
+
+def compile_stats(stats: Mapping[str, EndgameStats], path: str) -> None:
+    materials = list(stats)
+    table = sorted(materials)
+    index = {material: i for i, material in enumerate(table)}
+
+    records = []
+    for material in table:
+        endgame = stats[material]
+        sides = [endgame["histogram"]["white"], endgame["histogram"]["black"]]
+        hists = [hist for side in sides for hist in [side["win"], side["loss"]]]
+        rest = {key: value for key, value in endgame.items() if key != "histogram"}
+        blob = json.dumps(rest, separators=(",", ":")).encode("utf-8")
+        records.append(b"".join([
+            WDL.pack(*(side["wdl"].get(key, 0) for side in sides for key in WDL_KEYS)),
+            LENGTHS.pack(*(len(hist) for hist in hists)),
+            b"".join(struct.pack(f"<{len(hist)}Q", *hist) for hist in hists),
+            BLOB.pack(len(blob)),
+            blob,
+        ]))
+
+    offset = HEADER.size + len(table) * ENTRY.size + len(table) * ORDER.size
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(table)))
+        for material, record in zip(table, records):
+            f.write(ENTRY.pack(material.encode("ascii"), offset, len(record)))
+            offset += len(record)
+        for material in materials:
+            f.write(ORDER.pack(index[material]))
+        for record in records:
+            f.write(record)
+    os.replace(tmp, path)
+
+
+class StatsIndex(Mapping[str, EndgameStats]):
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled stats file")
+
+        self.count: int = count
+        self.order_offset = HEADER.size + self.count * ENTRY.size
+
+        # Decoding is not free, and the same few endgames are looked up
+        # over and over.
+        self.lookup = functools.lru_cache(maxsize=2048)(self._lookup)
+
+    def _find(self, material: str) -> int:
+        try:
+            key = material.encode("ascii").ljust(KEY_SIZE, b"\0")
+        except UnicodeEncodeError:
+            return -1
+
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo if lo < self.count and self._key(lo) == key else -1
+
+    def _key(self, i: int) -> bytes:
+        key: bytes = ENTRY.unpack_from(self.mmap, HEADER.size + i * ENTRY.size)[0]
+        return key
+
+    def __getitem__(self, material: str) -> EndgameStats:
+        return self.lookup(material)
+
+    def _lookup(self, material: str) -> EndgameStats:
+        i = self._find(material)
+        if i < 0:
+            raise KeyError(material)
+
+        _, offset, length = ENTRY.unpack_from(self.mmap, HEADER.size + i * ENTRY.size)
+        return self._decode(offset)
+
+    def __contains__(self, material: object) -> bool:
+        return isinstance(material, str) and self._find(material) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        for (i,) in ORDER.iter_unpack(self.mmap[self.order_offset:self.order_offset + self.count * ORDER.size]):
+            yield self._key(i).rstrip(b"\0").decode("ascii")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _decode(self, offset: int) -> EndgameStats:
+        wdl = WDL.unpack_from(self.mmap, offset)
+        offset += WDL.size
+
+        lengths = LENGTHS.unpack_from(self.mmap, offset)
+        offset += LENGTHS.size
+
+        hists: List[List[int]] = []
+        for length in lengths:
+            hists.append(list(struct.unpack_from(f"<{length}Q", self.mmap, offset)))
+            offset += 8 * length
+
+        (size,) = BLOB.unpack_from(self.mmap, offset)
+        offset += BLOB.size
+
+        stats: Dict[str, Any] = json.loads(self.mmap[offset:offset + size])
+        stats["histogram"] = {
+            "white": {
+                "win": hists[0],
+                "loss": hists[1],
+                "wdl": dict(zip(WDL_KEYS, wdl[:5])),
+            },
+            "black": {
+                "win": hists[2],
+                "loss": hists[3],
+                "wdl": dict(zip(WDL_KEYS, wdl[5:])),
+            },
+        }
+        return cast(EndgameStats, stats)
+
+
+def open_stats(json_path: str = STATS_JSON, bin_path: str = STATS_BIN) -> Mapping[str, EndgameStats]:
+    # stats.bin is only compiled ahead of time, never written while serving.
+    # If it is missing or outdated, load stats.json instead.
+    try:
+        stale = os.path.exists(json_path) and os.path.getmtime(json_path) > os.path.getmtime(bin_path)
+    except FileNotFoundError:
+        stale = True
+
+    if stale:
+        logger.warning(
+            "%s missing or outdated, loading %s instead (compile with python -m syzygy_tables_info.stats)",
+            bin_path,
+            json_path,
+        )
+        with open(json_path) as f:
+            stats: Dict[str, EndgameStats] = json.load(f)
+            return stats
+
+    return StatsIndex(bin_path)
+
+
+STATS: Mapping[str, EndgameStats]
+
+# The warmup thread and request threads may race to open the stats, which
+# is slow when falling back to stats.json.
+LOAD_LOCK = threading.Lock()
+
+
+def load() -> Mapping[str, EndgameStats]:
+    global STATS
+    try:
+        return STATS
+    except NameError:
+        pass
+    with LOAD_LOCK:
+        try:
+            return STATS
+        except NameError:
+            STATS = open_stats()
+            return STATS
+
+
+def __getattr__(name: str) -> Any:
+    # STATS is opened on first use, not on import.
+    if name == "STATS":
+        return load()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    with open(STATS_JSON) as f:
+        compile_stats(json.load(f), STATS_BIN)
@@ -0,0 +1,255 @@
+import asyncio
+import bisect
+import time
+
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import aiohttp.web
+
+from syzygy_tables_info.backend import BackendPool
+from syzygy_tables_info.local import LocalBackend
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def braces(labels: str) -> str:
+    return f"{{{labels}}}" if labels else ""
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str = "") -> Iterator[str]:
+        prefix = f"{labels}," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}'
+        cumulative += self.counts[-1]
+        yield f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative}'
+        yield f"{name}_sum{braces(labels)} {self.sum}"
+        yield f"{name}_count{braces(labels)} {cumulative}"
+
+
+class RouteStats:
+    def __init__(self, route: str) -> None:
+        self.labels = f'route="{route}"'
+        self.statuses: Dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+
+
+class BackendStats:
+    def __init__(self, endpoint: str) -> None:
+        self.labels = f'endpoint="{endpoint}"'
+        self.statuses: Dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.payload = Histogram(SIZE_BUCKETS)
+
+
+class Telemetry:
+    def __init__(self, *, lag_interval: float = 0.5) -> None:
+        # Series are created once per route or endpoint, so that recording
+        # a request is just a few integer increments.
+        self.routes: Dict[str, RouteStats] = {}
+        self.backends: Dict[str, BackendStats] = {}
+        self.in_flight = 0
+
+        self.lag_interval = lag_interval
+        self.lag = 0.0
+        self.lag_histogram = Histogram(LATENCY_BUCKETS)
+        self.lag_task: Optional[asyncio.Task[None]] = None
+        self.runner: Optional[aiohttp.web.AppRunner] = None
+
+        self.started = time.time()
+
+    def route(self, request: aiohttp.web.Request) -> RouteStats:
+        # Label by route pattern rather than path, to bound cardinality.
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "unmatched"
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats(route)
+        return stats
+
+    def backend(self, endpoint: str, status: int, latency: float, size: Optional[int] = None) -> None:
+        stats = self.backends.get(endpoint)
+        if stats is None:
+            stats = self.backends[endpoint] = BackendStats(endpoint)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.latency.observe(latency)
+        if size is not None:
+            stats.payload.observe(size)
+
+    @aiohttp.web.middleware
+    async def middleware(
+        self,
+        request: aiohttp.web.Request,
+        handler: Callable[[aiohttp.web.Request], Awaitable[aiohttp.web.StreamResponse]],
+    ) -> aiohttp.web.StreamResponse:
+        started = time.monotonic()
+        status = 500
+        self.in_flight += 1
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except aiohttp.web.HTTPException as err:
+            status = err.status
+            raise
+        finally:
+            self.in_flight -= 1
+            stats = self.route(request)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.latency.observe(time.monotonic() - started)
+
+    async def _monitor_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.lag = max(0.0, loop.time() - started - self.lag_interval)
+            self.lag_histogram.observe(self.lag)
+
+    def render(self, app: aiohttp.web.Application) -> Iterator[str]:
+        yield "# TYPE syzygy_worker_info gauge"
+        yield f'syzygy_worker_info{{worker="{app.get("worker", 0)}"}} 1'
+        yield "# TYPE syzygy_start_time_seconds gauge"
+        yield f"syzygy_start_time_seconds {self.started}"
+
+        yield "# TYPE syzygy_http_requests_total counter"
+        for stats in self.routes.values():
+            for status, count in stats.statuses.items():
+                yield f'syzygy_http_requests_total{{{stats.labels},status="{status}"}} {count}'
+        yield "# TYPE syzygy_http_request_duration_seconds histogram"
+        for stats in self.routes.values():
+            yield from stats.latency.render("syzygy_http_request_duration_seconds", stats.labels)
+        yield "# TYPE syzygy_http_requests_in_flight gauge"
+        yield f"syzygy_http_requests_in_flight {self.in_flight}"
+
+        yield "# TYPE syzygy_backend_requests_total counter"
+        for backend_stats in self.backends.values():
+            for status, count in backend_stats.statuses.items():
+                yield f'syzygy_backend_requests_total{{{backend_stats.labels},status="{status}"}} {count}'
+        yield "# TYPE syzygy_backend_request_duration_seconds histogram"
+        for backend_stats in self.backends.values():
+            yield from backend_stats.latency.render("syzygy_backend_request_duration_seconds", backend_stats.labels)
+        yield "# TYPE syzygy_backend_payload_bytes histogram"
+        for backend_stats in self.backends.values():
+            yield from backend_stats.payload.render("syzygy_backend_payload_bytes", backend_stats.labels)
+
+        yield "# TYPE syzygy_event_loop_lag_seconds gauge"
+        yield f"syzygy_event_loop_lag_seconds {self.lag}"
+        yield "# TYPE syzygy_event_loop_lag_histogram_seconds histogram"
+        yield from self.lag_histogram.render("syzygy_event_loop_lag_histogram_seconds")
+
+        yield from self.render_components(app)
+
+    def render_components(self, app: aiohttp.web.Application) -> Iterator[str]:
+        # Counters maintained by the individual components.
+        counters: List[Tuple[str, str, str, float]] = []
+
+        for name in ["probe_cache", "text_cache", "page_cache"]:
+            cache = app[name]
+            labels = f'cache="{name}"'
+            counters += [
+                ("syzygy_cache_hits_total", "counter", labels, cache.hits),
+                ("syzygy_cache_misses_total", "counter", labels, cache.misses),
+                ("syzygy_cache_evictions_total", "counter", labels, cache.evictions),
+                ("syzygy_cache_entries", "gauge", labels, len(cache)),
+                ("syzygy_cache_bytes", "gauge", labels, cache.bytes),
+            ]
+
+        for name in ["probe_flights", "mainline_flights", "download_flights"]:
+            flights = app[name]
+            labels = f'flight="{name}"'
+            counters += [
+                ("syzygy_single_flight_leaders_total", "counter", labels, flights.leaders),
+                ("syzygy_single_flight_followers_total", "counter", labels, flights.followers),
+                ("syzygy_single_flight_in_flight", "gauge", labels, len(flights.flights)),
+            ]
+
+        prefetcher = app["prefetcher"]
+        if prefetcher is not None:
+            for event in ["scheduled", "rate_limited", "dropped", "fetched", "failed", "hits"]:
+                counters.append(("syzygy_prefetch_total", "counter", f'event="{event}"', getattr(prefetcher, event)))
+            counters.append(("syzygy_prefetch_queue", "gauge", "", prefetcher.queue.qsize()))
+
+        admission = app["admission"]
+        for event in ["admitted", "rate_limited", "shed"]:
+            counters.append(("syzygy_admission_total", "counter", f'event="{event}"', getattr(admission, event)))
+        counters += [
+            ("syzygy_admission_active", "gauge", "", admission.active),
+            ("syzygy_admission_waiting", "gauge", "", admission.waiting),
+        ]
+
+        pool = app["backend"]
+        if isinstance(pool, BackendPool):
+            for backend in pool.backends:
+                labels = f'backend="{backend.url}"'
+                counters += [
+                    ("syzygy_backend_pool_requests_total", "counter", labels, backend.requests),
+                    ("syzygy_backend_pool_errors_total", "counter", labels, backend.errors),
+                    ("syzygy_backend_pool_ejections_total", "counter", labels, backend.ejections),
+                    ("syzygy_backend_pool_in_flight", "gauge", labels, backend.outstanding),
+                    ("syzygy_backend_pool_ejected", "gauge", labels, int(not backend.healthy(time.monotonic()))),
+                ]
+            counters += [
+                ("syzygy_backend_hedged_total", "counter", "", pool.hedged),
+                ("syzygy_backend_hedge_wins_total", "counter", "", pool.hedge_wins),
+                ("syzygy_backend_breaker_trips_total", "counter", "", pool.breaker.trips),
+                ("syzygy_backend_breaker_rejected_total", "counter", "", pool.breaker.rejected),
+                ("syzygy_backend_breaker_open", "gauge", "", int(pool.breaker.is_open())),
+            ]
+        elif isinstance(pool, LocalBackend):
+            counters += [
+                ("syzygy_local_probes_total", "counter", "", pool.probes),
+                ("syzygy_local_mainlines_total", "counter", "", pool.mainlines),
+                ("syzygy_local_in_flight", "gauge", "", pool.in_flight),
+            ]
+
+        typed = set()
+        for name, kind, labels, value in sorted(counters, key=lambda counter: counter[0]):
+            if name not in typed:
+                typed.add(name)
+                yield f"# TYPE {name} {kind}"
+            yield f"{name}{braces(labels)} {value}"
+
+    async def start(self, app: aiohttp.web.Application) -> None:
+        config = app["config"]
+        if not config.getboolean("telemetry", "enabled"):
+            return
+
+        self.lag_task = asyncio.create_task(self._monitor_lag())
+
+        async def export(request: aiohttp.web.Request) -> aiohttp.web.Response:
+            return aiohttp.web.Response(
+                body=("\n".join(self.render(app)) + "\n").encode("utf-8"),
+                headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+            )
+
+        # Served separately from the public site. Each worker slot listens
+        # on its own port. During a rolling restart the replacement binds it
+        # while the old worker still holds it, hence SO_REUSEPORT.
+        internal = aiohttp.web.Application()
+        internal.router.add_get(config.get("telemetry", "path"), export)
+        runner = aiohttp.web.AppRunner(internal, access_log=None)
+        await runner.setup()
+        worker = app.get("worker")
+        port = config.getint("telemetry", "port") + (worker or 0)
+        await aiohttp.web.TCPSite(runner, config.get("telemetry", "bind"), port, reuse_port=worker is not None).start()
+        self.runner = runner
+
+    async def stop(self, app: aiohttp.web.Application) -> None:
+        if self.lag_task is not None:
+            self.lag_task.cancel()
+        if self.runner is not None:
+            await self.runner.cleanup()
@@ -1,9 +1,8 @@
-import functools
-import os
 import textwrap
 
 import chess
 
+import syzygy_tables_info.assets
 import syzygy_tables_info.stats
 
 from syzygy_tables_info.model import ColorName, Render, RenderMove, RenderStats, DEFAULT_FEN
@@ -11,9 +10,8 @@ from tinyhtml import Frag, html, h, frag, raw
 from typing import Optional
 
 
-@functools.lru_cache
 def asset_url(path: str) -> str:
-    return "/static/{}?mtime={}".format(path, os.path.getmtime(os.path.join(os.path.dirname(__file__), "..", "static", path)))
+    return syzygy_tables_info.assets.manifest().url(path)
 
 
 def fen_url(fen: str) -> str:
@@ -876,6 +874,8 @@ def endgames(*, development: bool) -> Frag:
             ),
         )
 
+    materials = list(syzygy_tables_info.stats.STATS)
+
     return layout(
         development=development,
         title="Endgames",
@@ -898,12 +898,12 @@ def endgames(*, development: bool) -> Frag:
             h("section", id=f"{piece_count}-pieces")(
                 h("h2")(piece_count, " pieces"),
                 h("ul", klass="endgames")(
-                    item(material) for material in syzygy_tables_info.stats.STATS if len(material) == piece_count + 1
+                    item(material) for material in materials if len(material) == piece_count + 1
                 ) if piece_count < 5 else (
                     frag(
                         h("h3")("No pawns" if pawns == 0 else ("1 pawn" if pawns == 1 else f"{pawns} pawns")),
                         h("ul", klass="endgames")(
-                            item(material) for material in syzygy_tables_info.stats.STATS if len(material) == piece_count + 1 and material.count("P") == pawns
+                            item(material) for material in materials if len(material) == piece_count + 1 and material.count("P") == pawns
                         ),
                     ) for pawns in range(0, piece_count - 2 + 1)
                 )
@@ -0,0 +1,220 @@
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from types import FrameType
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    def __init__(self, index: int, process: "subprocess.Popen[bytes]", ready_fd: int) -> None:
+        self.index = index
+        self.process = process
+        self.ready_fd = ready_fd
+        self.started = time.monotonic()
+        self.ready = False
+
+
+class Supervisor:
+    def __init__(
+        self,
+        sock: socket.socket,
+        argv: List[str],
+        *,
+        workers: int,
+        ready_timeout: float = 60,
+        shutdown_timeout: float = 70,
+    ) -> None:
+        self.sock = sock
+        self.argv = argv
+        self.num_workers = workers
+        self.ready_timeout = ready_timeout
+        self.shutdown_timeout = shutdown_timeout
+
+        self.workers: Dict[int, Worker] = {}
+        self.stopping = False
+        self.reload_requested = False
+        self.stats_requested = False
+
+        # Per worker slot.
+        self.restarts = [0] * workers
+        self.crashes = [0] * workers
+        self.last_exit: List[Optional[int]] = [None] * workers
+        self.backoff = [0.0] * workers
+        self.not_before = [0.0] * workers
+
+    def spawn(self, index: int) -> Worker:
+        # Workers are started as fresh interpreters rather than forked, so
+        # that a rolling restart also picks up new code.
+        ready_read, ready_write = os.pipe()
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "syzygy_tables_info",
+                f"--fd={self.sock.fileno()}",
+                f"--ready-fd={ready_write}",
+                f"--worker={index}",
+            ]
+            + self.argv,
+            pass_fds=[self.sock.fileno(), ready_write],
+        )
+        os.close(ready_write)
+        logger.info("Started worker %d (pid %d)", index, process.pid)
+        return Worker(index, process, ready_read)
+
+    def wait_ready(self, worker: Worker) -> bool:
+        # Keep restarting crashed workers in other slots meanwhile.
+        deadline = time.monotonic() + self.ready_timeout
+        while not worker.ready and worker.process.poll() is None and not self.stopping:
+            readable, _, _ = select.select([worker.ready_fd], [], [], max(0, min(0.2, deadline - time.monotonic())))
+            if readable:
+                self.poll_ready(worker)
+            elif time.monotonic() >= deadline:
+                return False
+            else:
+                self.reap(skip=worker.index)
+        return worker.ready
+
+    def poll_ready(self, worker: Worker) -> None:
+        if not worker.ready and worker.ready_fd >= 0:
+            readable, _, _ = select.select([worker.ready_fd], [], [], 0)
+            if readable:
+                worker.ready = bool(os.read(worker.ready_fd, 1))
+                os.close(worker.ready_fd)
+                worker.ready_fd = -1
+
+    def stop(self, worker: Worker, *, terminate: bool = True) -> Optional[int]:
+        # Signal only once. A second SIGTERM would cut the graceful
+        # shutdown of the worker short.
+        if terminate:
+            worker.process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + self.shutdown_timeout
+        try:
+            while True:
+                try:
+                    return worker.process.wait(0.2)
+                except subprocess.TimeoutExpired:
+                    if time.monotonic() >= deadline:
+                        break
+                    self.reap(skip=worker.index)
+            logger.warning("Worker %d (pid %d) did not shut down in time", worker.index, worker.process.pid)
+            worker.process.kill()
+            return worker.process.wait()
+        finally:
+            if worker.ready_fd >= 0:
+                os.close(worker.ready_fd)
+                worker.ready_fd = -1
+
+    def rolling_restart(self) -> None:
+        # Replace one worker at a time, starting the new worker before
+        # stopping the old one, so that capacity is never reduced by more
+        # than one worker.
+        logger.info("Rolling restart of %d workers", self.num_workers)
+        for index in range(self.num_workers):
+            if self.stopping:
+                return
+
+            new = self.spawn(index)
+            if not self.wait_ready(new):
+                logger.error("Replacement for worker %d did not become ready, aborting rolling restart", index)
+                self.stop(new)
+                return
+
+            old = self.workers.get(index)
+            self.workers[index] = new
+            self.restarts[index] += 1
+            if old is not None:
+                self.last_exit[index] = self.stop(old)
+
+    def reap(self, skip: Optional[int] = None) -> None:
+        if self.stopping:
+            return
+
+        now = time.monotonic()
+        for index in range(self.num_workers):
+            if index == skip:
+                continue
+
+            worker = self.workers.get(index)
+            if worker is not None:
+                self.poll_ready(worker)
+                status = worker.process.poll()
+                if status is None:
+                    continue
+
+                # Crashed. Back off exponentially if the worker keeps
+                # crashing soon after starting.
+                del self.workers[index]
+                if worker.ready_fd >= 0:
+                    os.close(worker.ready_fd)
+                self.last_exit[index] = status
+                self.crashes[index] += 1
+                if now - worker.started < 10:
+                    self.backoff[index] = min(max(self.backoff[index] * 2, 0.5), 30)
+                else:
+                    self.backoff[index] = 0
+                self.not_before[index] = now + self.backoff[index]
+                logger.error("Worker %d (pid %d) exited with status %d, restarting in %.1fs", index, worker.process.pid, status, self.backoff[index])
+
+            if now >= self.not_before[index]:
+                self.workers[index] = self.spawn(index)
+                self.restarts[index] += 1
+
+    def log_stats(self) -> None:
+        now = time.monotonic()
+        for index in range(self.num_workers):
+            worker = self.workers.get(index)
+            logger.info(
+                "Worker %d: pid %s, %s, uptime %.0fs, %d restarts, %d crashes, last exit status %s",
+                index,
+                worker.process.pid if worker else "-",
+                "ready" if worker and worker.ready else "starting" if worker else "down",
+                now - worker.started if worker else 0,
+                self.restarts[index],
+                self.crashes[index],
+                self.last_exit[index],
+            )
+
+    def run(self) -> None:
+        def on_stop(signum: int, frame: Optional[FrameType]) -> None:
+            self.stopping = True
+
+        def on_reload(signum: int, frame: Optional[FrameType]) -> None:
+            self.reload_requested = True
+
+        def on_stats(signum: int, frame: Optional[FrameType]) -> None:
+            self.stats_requested = True
+
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+        signal.signal(signal.SIGUSR1, on_stats)
+
+        for index in range(self.num_workers):
+            self.workers[index] = self.spawn(index)
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            if self.stats_requested:
+                self.stats_requested = False
+                self.log_stats()
+            self.reap()
+            time.sleep(0.2)
+
+        logger.info("Shutting down %d workers", len(self.workers))
+        for worker in self.workers.values():
+            worker.process.send_signal(signal.SIGTERM)
+        for worker in list(self.workers.values()):
+            self.stop(worker, terminate=False)
+        self.workers.clear()
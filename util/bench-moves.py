@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+
+"""
+Micro-benchmark for the move list of the index page.
+
+Compares syzygy_tables_info.server.group_moves() against the previous
+implementation (push/pop for every move, chains of stable sorts) on random
+endgame positions, checks that both produce the same output, and reports
+CPU time per position.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+
+import chess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syzygy_tables_info.model import ApiMove  # noqa: E402
+from syzygy_tables_info.server import group_moves  # noqa: E402
+
+
+CATEGORIES = ["win", "maybe-win", "cursed-win", "draw", "blessed-loss", "maybe-loss", "loss", "unknown"]
+
+
+def reference(board: chess.Board, moves: List[Dict[str, Any]], *, fixed: bool) -> Dict[Optional[int], List[Dict[str, Any]]]:
+    grouped_moves: Dict[Optional[int], List[Dict[str, Any]]] = {-2: [], -1: [], 0: [], 1: [], 2: [], None: []}
+
+    for move_info in moves:
+        if move_info.get("checkmate"):
+            badge = "Checkmate"
+        elif move_info.get("stalemate"):
+            badge = "Stalemate"
+        elif move_info.get("insufficient_material"):
+            badge = "Insufficient material"
+        elif move_info.get("dtz") is None:
+            badge = "Unknown"
+        elif move_info["dtz"] == 0:
+            badge = "Draw"
+        elif move_info.get("zeroing"):
+            badge = "Zeroing"
+        elif move_info["dtz"] < 0:
+            badge = "Win with DTZ %d" % (abs(move_info["dtz"]),)
+        else:
+            badge = "Loss with DTZ %d" % (move_info["dtz"],)
+
+        if move_info["category"] in ["loss", "maybe-loss"]:
+            wdl: Optional[int] = -2
+        elif move_info["category"] == "blessed-loss":
+            wdl = -1
+        elif move_info["category"] == "draw":
+            wdl = 0
+        elif move_info["category"] == "cursed-win":
+            wdl = 1
+        elif move_info["category"] in ["win", "maybe-win"]:
+            wdl = 2
+        else:
+            wdl = None
+
+        dtm = abs(move_info["dtm"]) if move_info.get("dtm") is not None else None
+
+        try:
+            board.push_uci(move_info["uci"])
+            grouped_moves[wdl].append({
+                "uci": move_info["uci"],
+                "san": move_info["san"],
+                "fen": board.fen(),
+                "wdl": wdl,
+                "dtz": move_info.get("dtz"),
+                "dtm": dtm,
+                "zeroing": move_info["zeroing"],
+                "capture": "x" in move_info["san"],
+                "checkmate": move_info["checkmate"],
+                "stalemate": move_info["stalemate"],
+                "insufficient_material": move_info["insufficient_material"],
+                "badge": badge,
+            })
+        finally:
+            board.pop()
+
+    grouped_moves[-2].sort(key=lambda move: move["uci"])
+    grouped_moves[-2].sort(key=lambda move: (move["dtm"] is None, move["dtm"]))
+    grouped_moves[-2].sort(key=lambda move: (move["dtz"] is None, move["dtz"]), reverse=True)
+    grouped_moves[-2].sort(key=lambda move: move["zeroing"], reverse=True)
+    grouped_moves[-2].sort(key=lambda move: move["capture"], reverse=True)
+    grouped_moves[-2].sort(key=lambda move: move["checkmate"], reverse=True)
+
+    grouped_moves[None].sort(key=lambda move: move["uci"])
+    grouped_moves[None].sort(key=lambda move: move["zeroing"], reverse=True)
+    grouped_moves[None].sort(key=lambda move: move["capture"], reverse=True)
+
+    grouped_moves[-1].sort(key=lambda move: move["uci"])
+    grouped_moves[-1].sort(key=lambda move: (move["dtm"] is None, move["dtm"]))
+    grouped_moves[-1].sort(key=lambda move: (move["dtz"] is None, move["dtz"]), reverse=True)
+    grouped_moves[-1].sort(key=lambda move: move["zeroing"], reverse=True)
+    grouped_moves[-1].sort(key=lambda move: move["capture"], reverse=True)
+
+    grouped_moves[0].sort(key=lambda move: move["uci"])
+    grouped_moves[0].sort(key=lambda move: move["zeroing"], reverse=True)
+    grouped_moves[0].sort(key=lambda move: move["capture"], reverse=True)
+    grouped_moves[0].sort(key=lambda move: move["insufficient_material"], reverse=True)
+    grouped_moves[0].sort(key=lambda move: move["stalemate"], reverse=True)
+
+    grouped_moves[1].sort(key=lambda move: move["uci"])
+    grouped_moves[1].sort(key=lambda move: (move["dtm"] is not None, move["dtm"]), reverse=True)
+    grouped_moves[1].sort(key=lambda move: (move["dtz"] is None, move["dtz"]), reverse=True)
+    grouped_moves[1].sort(key=lambda move: move["zeroing"])
+    grouped_moves[1].sort(key=lambda move: move["capture"])
+
+    grouped_moves[2].sort(key=lambda move: move["uci"])
+    grouped_moves[2].sort(key=lambda move: (move["dtm"] is not None, move["dtm"]), reverse=True)
+    grouped_moves[2].sort(key=lambda move: (move["dtz"] is None, move["dtz"]), reverse=True)
+    grouped_moves[2].sort(key=lambda move: move["zeroing"])
+    if fixed:
+        grouped_moves[2].sort(key=lambda move: move["capture"])
+    else:
+        # Previously sorted the wrong group.
+        grouped_moves[1].sort(key=lambda move: move["capture"])
+
+    return grouped_moves
+
+
+def random_position(rng: random.Random) -> chess.Board:
+    while True:
+        board = chess.Board(None)
+        squares = rng.sample(chess.SQUARES, 64)
+        board.set_piece_at(squares.pop(), chess.Piece(chess.KING, chess.WHITE))
+        board.set_piece_at(squares.pop(), chess.Piece(chess.KING, chess.BLACK))
+        for _ in range(rng.randint(1, 5)):
+            piece = chess.Piece(rng.choice([chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]), rng.choice(chess.COLORS))
+            square = squares.pop()
+            if piece.piece_type != chess.PAWN or chess.square_rank(square) not in [0, 7]:
+                board.set_piece_at(square, piece)
+        board.turn = rng.choice(chess.COLORS)
+
+        # Occasionally castling rights and en passant squares, to cover the
+        # slow path.
+        if rng.random() < 0.05:
+            board.set_castling_fen(rng.choice(["K", "Q", "k", "q", "KQkq"]))
+        if rng.random() < 0.05:
+            board.ep_square = rng.choice(chess.SQUARES)
+
+        board.castling_rights = board.clean_castling_rights()
+        if board.ep_square is not None and board.ep_square != board._valid_ep_square():
+            board.ep_square = None
+        if board.is_valid() and not board.is_game_over():
+            return board
+
+
+def random_probe(board: chess.Board, rng: random.Random) -> List[Dict[str, Any]]:
+    moves = []
+    for move in board.legal_moves:
+        san = board.san(move)
+        zeroing = board.is_zeroing(move)
+        board.push(move)
+        category = rng.choice(CATEGORIES)
+        dtz = None if category == "unknown" or rng.random() < 0.05 else rng.randint(-30, 30)
+        moves.append({
+            "uci": move.uci(),
+            "san": san,
+            "category": category,
+            "dtz": dtz,
+            "dtm": rng.choice([None, rng.randint(-50, 50)]),
+            "zeroing": zeroing,
+            "checkmate": board.is_checkmate(),
+            "stalemate": board.is_stalemate(),
+            "insufficient_material": board.is_insufficient_material(),
+        })
+        board.pop()
+    rng.shuffle(moves)
+    return moves
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--positions", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    cases = []
+    for _ in range(args.positions):
+        board = random_position(rng)
+        cases.append((board, random_probe(board, rng)))
+
+    changed_order = 0
+    for board, moves in cases:
+        expected = reference(board, moves, fixed=True)
+        actual = group_moves(board, cast(List[ApiMove], moves))
+        assert actual == expected, board.fen()
+        changed_order += reference(board, moves, fixed=False) != expected
+
+    timings = {}
+    # Probes are generated as plain dicts (with dtz None for unknown moves),
+    # which group_moves() accepts as API moves.
+    benchmarks: List[Tuple[str, Callable[[chess.Board, List[Dict[str, Any]]], Any]]] = [
+        ("reference", lambda board, moves: reference(board, moves, fixed=True)),
+        ("group_moves", lambda board, moves: group_moves(board, cast(List[ApiMove], moves))),
+    ]
+    for name, fn in benchmarks:
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.process_time()
+            for board, moves in cases:
+                fn(board, moves)
+            best = min(best, time.process_time() - started)
+        timings[name] = best
+
+    total_moves = sum(len(moves) for _, moves in cases)
+    print(f"{len(cases)} positions, {total_moves} moves: identical output")
+    print(f"{changed_order} positions where the losing moves are now ordered by capture, as intended")
+    for name, best in timings.items():
+        print(f"{name}: {best * 1e6 / len(cases):.1f} us per position, {best * 1e6 / total_moves:.2f} us per move")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+
+"""
+Benchmark for util/stats.py on input the size of the full 7-piece set.
+
+Only the stats dumps for up to 6 pieces are in the repository, so a dump
+for all 1511 endgames up to 7 pieces is synthesized, with histograms as
+long as those of 7-piece endgames. Checksums are taken from checksums/.
+
+Compares against the previous pipeline (util/stats-v1.py followed by
+util/stats-v4.py, reproduced below), checks that both produce the same
+stats.json, and reports wall time.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import chess.syzygy
+
+from _ctypes import PyObj_FromPtr  # type: ignore
+
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+CHECKSUMS = ["md5", "sha1", "sha256", "sha512", "sha3-224", "b2", "b3"]
+
+
+def synthesize(f: Any, rng: random.Random, max_ply: int) -> None:
+    for material in chess.syzygy.tablenames(piece_count=7):
+        f.write(f"########## {material} ##########\n\n")
+        for side, mover in [("White", "w"), ("Black", "b")]:
+            f.write(f"{side} to move:\n\n")
+            wins = rng.randint(0, max_ply) if rng.random() < 0.8 else 0
+            for ply in range(1, wins + 1):
+                f.write(f"{rng.randint(0, 10**12)} positions win in {ply} ply.\n")
+            f.write("\n")
+            for label in ["wins", "cursed wins", "draws", "cursed losses", "losses"]:
+                if "cursed" not in label or rng.random() < 0.3:
+                    f.write(f"{rng.randint(0, 10**13)} positions are {label}.\n")
+            f.write("\n")
+            losses = rng.randint(0, max_ply) if rng.random() < 0.8 else 0
+            for ply in range(0, losses + 1 if losses else 0):
+                f.write(f"{rng.randint(0, 10**12)} positions lose in {ply} ply.\n")
+            f.write("\n\n")
+            if wins:
+                winner = "white" if mover == "w" else "black"
+                f.write(f"Longest win for {winner}: {wins} ply; 8/8/8/8/8/8/2Rk4/1K6 {mover} - -\n")
+        f.write("\n")
+
+
+# Previous pipeline.
+
+def sort_key(eg: str) -> Tuple[Any, ...]:
+    w, b = eg.split("v", 1)
+    return len(eg), len(w), [-chess.syzygy.PCHR.index(p) for p in w], len(b), [-chess.syzygy.PCHR.index(p) for p in b]
+
+
+def reference_process(f: Any) -> Iterator[Any]:
+    eg, side, data = None, "w", None
+
+    for line in f.readlines():
+        line = line.strip()
+        if line.startswith("###"):
+            if eg is not None:
+                yield eg, data
+
+            _, eg, _ = line.split(None, 2)
+            data = {
+                "w": {"win_hist": [], "loss_hist": [], "wdl": {-2: 0, -1: 0, 0: 0, 1: 0, 2: 0}},
+                "b": {"win_hist": [], "loss_hist": [], "wdl": {-2: 0, -1: 0, 0: 0, 1: 0, 2: 0}},
+                "longest": [],
+            }
+        elif "White to move" in line:
+            side = "w"
+        elif "Black to move" in line:
+            side = "b"
+        elif "positions win in" in line:
+            num, _, _, _, ply, _ = line.split(None, 5)
+            reference_set_ply(data[side]["win_hist"], int(ply), int(num))  # type: ignore
+        elif "positions lose in" in line:
+            num, _, _, _, ply, _ = line.split(None, 5)
+            reference_set_ply(data[side]["loss_hist"], int(ply), int(num))  # type: ignore
+        elif "positions are wins" in line:
+            num, _ = line.split(None, 1)
+            data[side]["wdl"][2] = int(num)  # type: ignore
+        elif "positions are cursed wins" in line:
+            num, _ = line.split(None, 1)
+            data[side]["wdl"][1] = int(num)  # type: ignore
+        elif "positions are losses" in line:
+            num, _ = line.split(None, 1)
+            data[side]["wdl"][-2] = int(num)  # type: ignore
+        elif "positions are cursed losses" in line:
+            num, _ = line.split(None, 1)
+            data[side]["wdl"][-1] = int(num)  # type: ignore
+        elif "positions are draws" in line:
+            num, _ = line.split(None, 1)
+            data[side]["wdl"][0] = int(num)  # type: ignore
+        elif "Longest" in line:
+            label, desc = line.split(": ", 1)
+            ply, _, epd = desc.split(None, 2)
+            if (" w " in epd) == ("win for white" in label):
+                wdl = 1
+            else:
+                wdl = -1
+            if "cursed" not in label:
+                wdl *= 2
+            data["longest"].append({"epd": epd, "ply": int(ply), "wdl": wdl})  # type: ignore
+
+    if eg is not None:
+        yield eg, data
+
+
+def reference_set_ply(h: List[int], ply: int, num: int) -> None:
+    while len(h) <= ply:
+        h.append(0)
+    h[ply] = num
+
+
+class NoIndent:
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+
+class JsonEncoder(json.JSONEncoder):
+    FORMAT_SPEC = "@@{}@@"
+    regex = re.compile(FORMAT_SPEC.format(r"(\d+)"))
+
+    def default(self, obj: Any) -> Any:
+        return self.FORMAT_SPEC.format(id(obj)) if isinstance(obj, NoIndent) else super().default(obj)
+
+    def encode(self, obj: Any) -> str:
+        json_repr = super().encode(obj)
+        for match in self.regex.finditer(json_repr):
+            id = int(match.group(1))
+            no_indent = PyObj_FromPtr(id)
+            json_repr = json_repr.replace('"{}"'.format(self.FORMAT_SPEC.format(id)), json.dumps(no_indent.value))
+        return json_repr
+
+
+def reference(dump: str, checksums: str, output: str) -> None:
+    # stats-v1.py, written to and read back from an intermediate file.
+    with open(dump) as f:
+        intermediate = {eg: data for eg, data in reference_process(f)}
+    tmp = output + ".v1"
+    with open(tmp, "w") as f:
+        f.write(json.dumps(dict(sorted(intermediate.items(), key=lambda item: sort_key(item[0]))), indent=2))
+    with open(tmp) as f:
+        stats = json.load(f)
+    os.remove(tmp)
+
+    # stats-v4.py, on the histograms in the intermediate format.
+    sizes = {}
+    for line in open(os.path.join(checksums, "bytes.tsv")):
+        b, filename = line.strip().split()
+        sizes[filename] = int(b)
+    internal = {}
+    for line in open(os.path.join(checksums, "tbcheck.txt")):
+        filename, h = line.strip().split(": ")
+        internal[filename] = h
+    hashes: Dict[str, Dict[str, str]] = {algo: {} for algo in CHECKSUMS}
+    for algo in hashes:
+        for line in open(os.path.join(checksums, algo)):
+            h, filename = line.strip().split()
+            hashes[algo][filename] = h
+
+    result = {}
+    for table in sorted(stats, key=sort_key):
+        result[table] = {
+            ext: {
+                "bytes": sizes[f"{table}.{ext}"],
+                "tbcheck": internal[f"{table}.{ext}"],
+                **{algo: hashes[algo][f"{table}.{ext}"] for algo in CHECKSUMS},
+            }
+            for ext in ["rtbw", "rtbz"]
+        }
+        result[table]["longest"] = stats[table]["longest"]
+        result[table]["histogram"] = {
+            color: {
+                "win": NoIndent(stats[table][side]["win_hist"]),
+                "loss": NoIndent(stats[table][side]["loss_hist"]),
+                "wdl": stats[table][side]["wdl"],
+            }
+            for color, side in [("white", "w"), ("black", "b")]
+        }
+
+    with open(output, "w") as f:
+        print(json.dumps(result, indent=2, cls=JsonEncoder), file=f)
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-ply", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--skip-reference", action="store_true")
+    args = parser.parse_args(argv)
+
+    checksums = os.path.join(ROOT, "checksums")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "regular-stats.txt")
+        with open(dump, "w") as f:
+            synthesize(f, random.Random(args.seed), args.max_ply)
+        print(f"synthesized {os.path.getsize(dump) / 1e6:.1f} MB of stats dumps")
+
+        timings = {}
+        outputs: Dict[str, Optional[str]] = {}
+
+        for jobs in sorted({1, args.jobs}):
+            output = os.path.join(tmp, f"stats-{jobs}.json")
+            started = time.perf_counter()
+            subprocess.run(
+                [sys.executable, os.path.join(ROOT, "util", "stats.py"), dump, "--checksums", checksums, "--jobs", str(jobs), "--output", output],
+                check=True,
+            )
+            timings[f"util/stats.py --jobs {jobs}"] = time.perf_counter() - started
+            outputs[output] = None
+
+        if not args.skip_reference:
+            output = os.path.join(tmp, "reference.json")
+            started = time.perf_counter()
+            reference(dump, checksums, output)
+            timings["stats-v1.py + stats-v4.py"] = time.perf_counter() - started
+            outputs[output] = None
+
+        for output in outputs:
+            with open(output) as f:
+                outputs[output] = f.read()
+        assert len(set(outputs.values())) == 1, "outputs differ"
+        print(f"identical output, {len(next(iter(outputs.values())) or '') / 1e6:.1f} MB")
+
+        for name, elapsed in timings.items():
+            print(f"{name}: {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,404 @@
+#!/usr/bin/python3
+
+"""
+End-to-end load benchmark.
+
+Starts the app from a source tree against a local stand-in for the
+tablebase API, drives a fixed set of scenarios at fixed concurrency, and
+prints throughput and latency percentiles as JSON. Compare runs between
+commits, for example using a second worktree:
+
+    python util/bench.py --output new.json
+    python util/bench.py --tree ../base --output old.json
+
+The stand-in backend serves recorded responses (by default those in
+util/bench-responses.cbor), and synthesizes plausible responses for
+positions that were not recorded. Record from the tablebase API, or from
+local tables (the committed recording uses the 3-5 piece tables that ship
+with python-chess, so larger positions are recorded as unknown):
+
+    python util/bench.py record --output util/bench-responses.cbor
+    python util/bench.py record --tables path/to/syzygy --output util/bench-responses.cbor
+
+The *-uncached scenarios run against a separate instance with the page
+cache disabled, to measure probing, move grouping and rendering rather
+than cache hits.
+"""
+
+import argparse
+import asyncio
+import configparser
+import hashlib
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+import aiohttp.web
+import cbor2
+import chess
+import chess.syzygy
+
+
+POSITIONS = [
+    "4k3/8/8/8/8/8/8/4K3 w - - 0 1",
+    "4k3/8/8/8/8/8/8/4KQ2 w - - 0 1",
+    "8/8/8/8/8/8/R7/K3k3 b - - 0 1",
+    "8/8/4k3/8/8/3PK3/8/8 w - - 0 1",
+    "6k1/8/8/8/8/8/5PPP/6K1 w - - 0 1",
+    "8/8/8/2k5/8/8/1R6/K2r4 w - - 0 1",
+    "4k3/8/8/8/8/8/3Q4/3QK3 w - - 0 1",
+    "8/2q5/8/3k4/8/8/1Q6/2QK4 w - - 0 1",
+    "1q6/8/8/7k/8/8/QQ6/2K5 w - - 0 1",
+    "8/8/8/8/6k1/8/1QRB4/1K6 w - - 0 1",
+    "8/8/1p6/8/7k/8/1PQN4/1K6 w - - 0 1",
+    "6k1/8/8/3n4/8/8/2QRR3/1K6 b - - 0 1",
+    "6k1/8/8/8/8/8/1QQQ4/K6q w - - 0 1",
+    "7k/8/8/8/8/8/QRBN4/K7 w - - 0 1",
+    "8/8/8/4k3/8/2b5/1PP5/1K1R4 w - - 0 1",
+    "R7/8/8/8/8/2k3r1/1p6/1K6 b - - 0 1",
+]
+
+MATERIALS = ["KQvK", "KRvK", "KPvK", "KRvKR", "KQvKR", "KRPvKR", "KQQvKQ", "KRBvKR", "KPPvKP", "KBNvK"]
+
+
+RESPONSES = os.path.join(os.path.dirname(__file__), "bench-responses.cbor")
+
+UNCACHED = ["cache.page_entries=0"]
+
+
+def record_local(args: argparse.Namespace) -> Dict[str, Dict[str, Optional[bytes]]]:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    import syzygy_tables_info.local as local
+
+    local.open_tablebase(args.tables)
+    responses: Dict[str, Dict[str, Optional[bytes]]] = {}
+    for fen in POSITIONS:
+        fen = chess.Board(fen).fen()
+        probe, _ = local.probe_fen(fen)
+        mainline, _ = local.mainline_fen(fen)
+        responses[fen] = {
+            "probe": cbor2.dumps(probe),
+            "mainline": cbor2.dumps(mainline) if mainline is not None else None,
+        }
+        print(fen, file=sys.stderr)
+    return responses
+
+
+def record(args: argparse.Namespace) -> None:
+    responses: Dict[str, Dict[str, Optional[bytes]]] = {}
+
+    async def run() -> None:
+        async with aiohttp.ClientSession(headers={"Accept": "application/cbor"}) as session:
+            for fen in POSITIONS:
+                fen = chess.Board(fen).fen()
+                entry: Dict[str, Optional[bytes]] = {}
+                for key, path in [("probe", ""), ("mainline", "/mainline")]:
+                    async with session.get(args.backend + path, params={"fen": fen}) as res:
+                        entry[key] = await res.read() if res.status == 200 else None
+                    await asyncio.sleep(args.delay)
+                responses[fen] = entry
+                print(fen, file=sys.stderr)
+
+    if args.tables:
+        responses = record_local(args)
+    else:
+        asyncio.run(run())
+    with open(args.output, "wb") as f:
+        cbor2.dump(responses, f)
+
+
+def synthesize_probe(fen: str) -> bytes:
+    # Deterministic, roughly realistic response shape.
+    board = chess.Board(fen)
+    h = int(hashlib.sha1(fen.encode("ascii")).hexdigest(), 16)
+    categories = ["loss", "loss", "draw", "win", "cursed-win", "blessed-loss"]
+    moves = []
+    for i, move in enumerate(board.legal_moves):
+        san = board.san(move)
+        zeroing = board.is_zeroing(move)
+        board.push(move)
+        category = categories[(h >> i) % len(categories)]
+        dtz = 0 if category == "draw" else (1 if "win" in category else -1) * (1 + (h + i) % 40)
+        moves.append({
+            "uci": move.uci(),
+            "san": san,
+            "category": category,
+            "dtz": dtz,
+            "precise_dtz": dtz,
+            "dtm": None,
+            "zeroing": zeroing,
+            "checkmate": board.is_checkmate(),
+            "stalemate": board.is_stalemate(),
+            "insufficient_material": board.is_insufficient_material(),
+        })
+        board.pop()
+
+    category = "win" if any(m["category"] in ["loss", "blessed-loss"] for m in moves) else "draw" if moves else "loss"
+    return cbor2.dumps({
+        "category": category,
+        "dtz": 0 if category == "draw" else 1 + h % 40,
+        "precise_dtz": 0 if category == "draw" else 1 + h % 40,
+        "dtm": None,
+        "checkmate": board.is_checkmate(),
+        "stalemate": board.is_stalemate(),
+        "insufficient_material": board.is_insufficient_material(),
+        "moves": moves,
+    })
+
+
+def synthesize_mainline(fen: str) -> bytes:
+    board = chess.Board(fen)
+    h = int(hashlib.sha1(fen.encode("ascii")).hexdigest(), 16)
+    mainline = []
+    for ply in range(h % 120):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        move = moves[(h >> ply) % len(moves)]
+        board.push(move)
+        mainline.append({"uci": move.uci(), "dtz": (h + ply) % 9 - 4})
+    return cbor2.dumps({"dtz": 1 + h % 40, "mainline": mainline, "winner": "w"})
+
+
+def serve_backend(port: int, latency: float, responses_path: Optional[str]) -> None:
+    responses: Dict[str, Dict[str, Optional[bytes]]] = {}
+    if responses_path:
+        with open(responses_path, "rb") as f:
+            responses = cbor2.load(f)
+
+    def lookup(fen: str, key: str) -> Optional[bytes]:
+        entry = responses.setdefault(fen, {})
+        if key not in entry:
+            entry[key] = synthesize_probe(fen) if key == "probe" else synthesize_mainline(fen)
+        return entry[key]
+
+    async def probe(request: aiohttp.web.Request) -> aiohttp.web.Response:
+        await asyncio.sleep(latency)
+        body = lookup(request.query["fen"], "probe")
+        if body is None:
+            raise aiohttp.web.HTTPNotFound()
+        return aiohttp.web.Response(body=body, content_type="application/cbor")
+
+    async def mainline(request: aiohttp.web.Request) -> aiohttp.web.Response:
+        await asyncio.sleep(latency)
+        body = lookup(request.query["fen"], "mainline")
+        if body is None:
+            raise aiohttp.web.HTTPNotFound()
+        return aiohttp.web.Response(body=body, content_type="application/cbor")
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/standard", probe)
+    app.router.add_get("/standard/mainline", mainline)
+    aiohttp.web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def serve_app(tree: str, port: int, backend_port: int, overrides: List[str]) -> None:
+    sys.path.insert(0, tree)
+    os.chdir(tree)
+    import syzygy_tables_info.server
+
+    config = configparser.ConfigParser()
+    config.read([os.path.join(tree, "config.default.ini")])
+    config.set("server", "development", "no")
+    config.set("server", "backend", f"http://127.0.0.1:{backend_port}/standard")
+    if config.has_section("limits"):
+        # All load comes from a single client.
+        config.set("limits", "rate", "0")
+    for override in overrides:
+        key, value = override.split("=", 1)
+        section, option = key.split(".", 1)
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, option, value)
+
+    aiohttp.web.run_app(
+        syzygy_tables_info.server.make_app(config),
+        host="127.0.0.1",
+        port=port,
+        print=None,
+        access_log=None,
+    )
+
+
+def scenarios() -> Dict[str, List[str]]:
+    fens = [chess.Board(fen).fen().replace(" ", "_") for fen in POSITIONS]
+    return {
+        "index": [f"/?fen={fen}" for fen in fens],
+        "xhr": [f"/?fen={fen}&xhr=probe" for fen in fens],
+        "index-uncached": [f"/?fen={fen}" for fen in fens],
+        "xhr-uncached": [f"/?fen={fen}&xhr=probe" for fen in fens],
+        "pgn": [
+            f"/syzygy-vs-syzygy/{chess.syzygy.calc_key(chess.Board(fen.replace('_', ' ')))}.pgn?fen={fen}"
+            for fen in fens
+        ],
+        "download": [
+            "/download.txt",
+            "/download.txt?source=sesse&dtz=root",
+            "/download/KRPvKR.txt?source=file",
+            "/download/KQRvKQ,KRPvKR.txt?max-pieces=6",
+        ],
+        "graph": ["/graph.dot", "/graph/KRPvKR.dot", "/graph/KQRvKQ,KRPvKR.dot"],
+        "stats": [f"/stats/{material}.json" for material in MATERIALS],
+    }
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    # Linux only.
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def drive(base: str, paths: List[str], *, concurrency: int, duration: float, warmup: float) -> Tuple[List[float], Dict[int, int]]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers={"Accept-Encoding": "gzip"}) as session:
+        async def worker(index: int, until: float, measure: bool) -> None:
+            i = index
+            while time.monotonic() < until:
+                path = paths[i % len(paths)]
+                i += concurrency
+                started = time.monotonic()
+                async with session.get(base + path, allow_redirects=False) as res:
+                    await res.read()
+                if measure:
+                    latencies.append(time.monotonic() - started)
+                    statuses[res.status] = statuses.get(res.status, 0) + 1
+
+        for until, measure in [(time.monotonic() + warmup, False), (time.monotonic() + warmup + duration, True)]:
+            await asyncio.gather(*(worker(index, until, measure) for index in range(concurrency)))
+    return latencies, statuses
+
+
+async def wait_until_up(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as res:
+                    if res.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up")
+            await asyncio.sleep(0.2)
+
+
+def run(args: argparse.Namespace) -> None:
+    tree = os.path.abspath(args.tree)
+    available = scenarios()
+    selected = args.scenario or list(available)
+
+    try:
+        commit: Optional[str] = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=tree, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    result: Dict[str, Any] = {
+        "commit": commit,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "latency": args.latency,
+        "responses": args.responses,
+        "set": args.set,
+        "scenarios": {},
+    }
+
+    responses = args.responses if args.responses and os.path.exists(args.responses) else None
+    ctx = multiprocessing.get_context("spawn")
+    backend = ctx.Process(target=serve_backend, args=(args.backend_port, args.latency, responses), daemon=True)
+    backend.start()
+    try:
+        asyncio.run(wait_until_up(f"http://127.0.0.1:{args.backend_port}/standard?fen=8/8/8/8/8/8/8/K1k5%20w%20-%20-%200%201"))
+
+        # One app instance for each set of config overrides.
+        groups: Dict[Tuple[str, ...], List[str]] = {}
+        for name in selected:
+            overrides = tuple(args.set + (UNCACHED if name.endswith("-uncached") else []))
+            groups.setdefault(overrides, []).append(name)
+
+        for overrides, names in groups.items():
+            server = ctx.Process(target=serve_app, args=(tree, args.port, args.backend_port, list(overrides)), daemon=True)
+            server.start()
+            try:
+                base = f"http://127.0.0.1:{args.port}"
+                asyncio.run(wait_until_up(base + "/legal"))
+                for name in names:
+                    cpu_before = cpu_seconds(server.pid or 0)
+                    latencies, statuses = asyncio.run(drive(base, available[name], concurrency=args.concurrency, duration=args.duration, warmup=args.warmup))
+                    cpu_after = cpu_seconds(server.pid or 0)
+                    latencies.sort()
+                    result["scenarios"][name] = {
+                        "requests": len(latencies),
+                        "rps": round(len(latencies) / args.duration, 1),
+                        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+                        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0,
+                        "cpu_ms_per_request": (
+                            round((cpu_after - cpu_before) * 1000 / len(latencies), 3)
+                            if cpu_before is not None and cpu_after is not None and latencies else None
+                        ),
+                        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+                    }
+                    print(name, json.dumps(result["scenarios"][name]), file=sys.stderr)
+            finally:
+                server.terminate()
+                server.join()
+    finally:
+        backend.terminate()
+        backend.join()
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.set_defaults(command=run)
+    parser.add_argument("--tree", default=os.path.join(os.path.dirname(__file__), ".."), help="source tree to benchmark")
+    parser.add_argument("--port", type=int, default=5090)
+    parser.add_argument("--backend-port", type=int, default=5091)
+    parser.add_argument("--latency", type=float, default=0.005, help="artificial backend latency in seconds")
+    parser.add_argument("--responses", default=RESPONSES, help="recorded backend responses")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1, help="seconds per scenario")
+    parser.add_argument("--scenario", action="append", choices=list(scenarios()), help="run only selected scenarios")
+    parser.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=VALUE", help="override config, for example cache.probe_entries=0")
+    parser.add_argument("--output", help="write JSON results to file")
+
+    subparsers = parser.add_subparsers()
+    record_parser = subparsers.add_parser("record", help="record backend responses")
+    record_parser.set_defaults(command=record)
+    record_parser.add_argument("--backend", default="https://tablebase.lichess.ovh/standard")
+    record_parser.add_argument("--delay", type=float, default=1, help="seconds between requests")
+    record_parser.add_argument("--tables", action="append", help="record from local tablebase directories instead")
+    record_parser.add_argument("--output", required=True)
+
+    args = parser.parse_args(argv)
+    args.command(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,325 @@
+#!/usr/bin/python3
+
+"""
+Builds stats.json from tablebase generator output and checksum lists.
+
+Stats dumps (like stats/regular/regular-stats.txt) are split at endgame
+boundaries and parsed in parallel. Checksums are joined in a single pass
+over each list in the checksum directory. The output is written one endgame
+at a time, in the usual order, with histograms on a single line.
+
+Endgames missing from the given dumps can be taken from a previous
+stats.json, for example to refresh checksums without the dumps:
+
+    python util/stats.py --previous stats.json --output stats.json
+
+With --state, the inputs of each endgame (its block in the dumps, its
+checksum lines, its download locations) are fingerprinted and remembered
+together with its output. Subsequent runs only parse and encode endgames
+whose inputs changed, for example after appending newly generated tables
+or fixing a checksum:
+
+    python util/stats.py stats/regular/*.txt --state stats.state --output stats.json
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import os
+import sys
+
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+import chess.syzygy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syzygy_tables_info.stats import EndgameStats, Histogram, LongEndgame, TableStats  # noqa: E402
+
+
+CHECKSUMS = ["md5", "sha1", "sha256", "sha512", "sha3-224", "b2", "b3"]
+
+WDL_LABELS = {
+    "wins.": "2",
+    "cursed wins.": "1",
+    "draws.": "0",
+    "cursed losses.": "-1",
+    "losses.": "-2",
+}
+
+
+def sort_key(material: str) -> Tuple[Any, ...]:
+    w, b = material.split("v", 1)
+    return len(material), len(w), [-chess.syzygy.PCHR.index(p) for p in w], len(b), [-chess.syzygy.PCHR.index(p) for p in b]
+
+
+def empty_histogram() -> Histogram:
+    return {"win": [], "loss": [], "wdl": {"-2": 0, "-1": 0, "0": 0, "1": 0, "2": 0}}
+
+
+def set_ply(hist: List[int], ply: int, num: int) -> None:
+    if len(hist) <= ply:
+        hist.extend([0] * (ply + 1 - len(hist)))
+    hist[ply] = num
+
+
+def parse_lines(lines: Iterator[str]) -> Iterator[Tuple[str, List[LongEndgame], Histogram, Histogram]]:
+    material: Optional[str] = None
+    longest: List[LongEndgame] = []
+    white = black = side = empty_histogram()
+
+    for line in lines:
+        if not line or line.isspace():
+            continue
+
+        # Dispatch on the first character, rather than searching each line
+        # for every possible phrase.
+        first = line[0]
+        if first == "#":
+            if material is not None:
+                yield material, longest, white, black
+            material = line.split()[1]
+            longest = []
+            white, black = empty_histogram(), empty_histogram()
+            side = white
+        elif first == "W":
+            side = white
+        elif first == "B":
+            side = black
+        elif first == "L":
+            # Longest win for white: 20 ply; 8/8/8/2B4B/1B6/B5k1/8/K7 b - -
+            label, desc = line.rstrip().split(": ", 1)
+            ply, _, epd = desc.split(None, 2)
+            wdl = 1 if (" w " in epd) == ("win for white" in label) else -1
+            if "cursed" not in label:
+                wdl *= 2
+            longest.append({"epd": epd, "ply": int(ply), "wdl": wdl})
+        else:
+            parts = line.split()
+            kind = parts[2]
+            if kind == "win":
+                set_ply(side["win"], int(parts[4]), int(parts[0]))
+            elif kind == "lose":
+                set_ply(side["loss"], int(parts[4]), int(parts[0]))
+            elif kind == "are":
+                side["wdl"][WDL_LABELS[" ".join(parts[3:])]] = int(parts[0])
+
+    if material is not None:
+        yield material, longest, white, black
+
+
+def parse_range(path: str, start: int, stop: int) -> List[Tuple[str, List[LongEndgame], Histogram, Histogram]]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    return list(parse_lines(iter(data.decode("utf-8").splitlines())))
+
+
+class Block(NamedTuple):
+    path: str
+    start: int
+    stop: int
+    digest: str
+
+
+def index_blocks(path: str) -> Iterator[Tuple[str, Block]]:
+    # Locate and fingerprint each endgame, without parsing it.
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = mm.find(b"#")
+            while pos != -1:
+                next_pos = mm.find(b"\n#", pos)
+                stop = size if next_pos == -1 else next_pos + 1
+                header_end = mm.find(b"\n", pos, stop)
+                material = mm[pos:stop if header_end == -1 else header_end].split()[1].decode("ascii")
+                digest = hashlib.blake2b(mm[pos:stop], digest_size=16).hexdigest()
+                yield material, Block(path, pos, stop, digest)
+                pos = -1 if next_pos == -1 else next_pos + 1
+
+
+def plan_ranges(blocks: List[Block], parts: int) -> List[Tuple[str, int, int]]:
+    # Merge adjacent blocks into roughly equal ranges for the workers.
+    target = sum(block.stop - block.start for block in blocks) // parts
+    ranges: List[Tuple[str, int, int]] = []
+    for block in sorted(blocks):
+        if ranges and ranges[-1][0] == block.path and ranges[-1][2] == block.start and ranges[-1][2] - ranges[-1][1] < target:
+            ranges[-1] = (block.path, ranges[-1][1], block.stop)
+        else:
+            ranges.append((block.path, block.start, block.stop))
+    return ranges
+
+
+def read_checksums(directory: str) -> Dict[str, Dict[str, Any]]:
+    # Index by filename (like KRvK.rtbw), in one pass over each list.
+    files: Dict[str, Dict[str, Any]] = {}
+
+    with open(os.path.join(directory, "bytes.tsv")) as f:
+        for line in f:
+            size, filename = line.split()
+            files[filename] = {"bytes": int(size)}
+
+    with open(os.path.join(directory, "tbcheck.txt")) as f:
+        for line in f:
+            filename, h = line.rstrip("\n").split(": ")
+            files[filename]["tbcheck"] = h
+
+    for algo in CHECKSUMS:
+        with open(os.path.join(directory, algo)) as f:
+            for line in f:
+                h, filename = line.split()
+                files[filename][algo] = h
+
+    return files
+
+
+def encode(obj: Any, indent: str = "") -> str:
+    # Like json.dumps(obj, indent=2), but keeping lists of numbers (the
+    # histograms) on a single line.
+    if isinstance(obj, dict) and obj:
+        inner = indent + "  "
+        items = ",\n".join(f"{inner}{json.dumps(key)}: {encode(value, inner)}" for key, value in obj.items())
+        return f"{{\n{items}\n{indent}}}"
+    elif isinstance(obj, list) and obj and not all(type(item) is int for item in obj):
+        inner = indent + "  "
+        items = ",\n".join(inner + encode(item, inner) for item in obj)
+        return f"[\n{items}\n{indent}]"
+    else:
+        return json.dumps(obj)
+
+
+def fingerprint(value: Any) -> str:
+    return hashlib.blake2b(json.dumps(value, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def write_stats(f: TextIO, entries: Iterator[Tuple[str, str]]) -> int:
+    count = 0
+    f.write("{")
+    for material, entry in entries:
+        f.write(",\n  " if count else "\n  ")
+        f.write(json.dumps(material))
+        f.write(": ")
+        f.write(entry)
+        count += 1
+    f.write("\n}\n" if count else "}\n")
+    return count
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dumps", nargs="*", help="generator output, like stats/regular/regular-stats.txt")
+    parser.add_argument("--checksums", default="checksums", help="directory with bytes.tsv, tbcheck.txt, md5, ...")
+    parser.add_argument("--previous", help="take endgames missing from the dumps from this stats.json")
+    parser.add_argument("--meta", help="syzygy-meta.json with download locations")
+    parser.add_argument("--state", help="rebuild only endgames with changed inputs, remembering fingerprints in this file")
+    parser.add_argument("--output", default="-", help="defaults to stdout")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--allow-shrink", action="store_true", help="write output with fewer endgames than the state file, or none")
+    args = parser.parse_args(argv)
+
+    files = read_checksums(args.checksums)
+
+    # Later dumps take precedence.
+    blocks: Dict[str, Block] = {}
+    for path in args.dumps:
+        blocks.update(index_blocks(path))
+
+    previous: Dict[str, EndgameStats] = {}
+    downloads: Dict[str, Any] = {}
+    if args.previous:
+        with open(args.previous) as f:
+            previous = json.load(f)
+        for material, previous_endgame in previous.items():
+            for ext, table_stats in [("rtbw", previous_endgame["rtbw"]), ("rtbz", previous_endgame["rtbz"])]:
+                if "files" in table_stats:
+                    downloads[f"{material}.{ext}"] = table_stats["files"]  # type: ignore
+    if args.meta:
+        with open(args.meta) as f:
+            for table_info in json.load(f):
+                ext = "rtbw" if table_info["metric"] == "wdl" else "rtbz"
+                downloads[f"{table_info['material']}.{ext}"] = table_info["files"]
+
+    state: Dict[str, Any] = {}
+    if args.state:
+        try:
+            with open(args.state) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            pass
+
+    # Fingerprint the inputs of each endgame, and find those that changed.
+    materials = sorted(set(blocks) | set(previous), key=sort_key)
+
+    # Most likely the dumps were not found, or --previous was forgotten.
+    # Refuse rather than replacing stats.json and the state.
+    if not args.allow_shrink and not materials:
+        print("error: no endgames in the given dumps, and no --previous (use --allow-shrink)", file=sys.stderr)
+        sys.exit(1)
+    elif not args.allow_shrink and len(materials) < len(state):
+        print(f"error: only {len(materials)} endgames, but {len(state)} in the state file (use --allow-shrink)", file=sys.stderr)
+        sys.exit(1)
+    inputs: Dict[str, Dict[str, str]] = {}
+    changed: List[str] = []
+    for material in materials:
+        filenames = [f"{material}.rtbw", f"{material}.rtbz"]
+        inputs[material] = {
+            "stats": blocks[material].digest if material in blocks else fingerprint([previous[material]["longest"], previous[material]["histogram"]]),
+            "checksums": fingerprint([files.get(filename) for filename in filenames]),
+            "meta": fingerprint([downloads.get(filename) for filename in filenames]),
+        }
+        if state.get(material, {}).get("inputs") != inputs[material]:
+            changed.append(material)
+
+    endgames: Dict[str, Tuple[List[LongEndgame], Histogram, Histogram]] = {}
+    ranges = plan_ranges([blocks[material] for material in changed if material in blocks], args.jobs * 4)
+    if ranges:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(parse_range, path, start, stop) for path, start, stop in ranges]
+            for future in futures:
+                for material, longest, white, black in future.result():
+                    endgames[material] = longest, white, black
+
+    def table(filename: str) -> TableStats:
+        if filename not in downloads:
+            return files[filename]  # type: ignore
+        return dict(files[filename], files=downloads[filename])  # type: ignore
+
+    for material in changed:
+        if material in blocks:
+            longest, white, black = endgames[material]
+        else:
+            longest = previous[material]["longest"]
+            white = previous[material]["histogram"]["white"]
+            black = previous[material]["histogram"]["black"]
+        endgame: EndgameStats = {
+            "rtbw": table(f"{material}.rtbw"),
+            "rtbz": table(f"{material}.rtbz"),
+            "longest": longest,
+            "histogram": {"white": white, "black": black},
+        }
+        state[material] = {"inputs": inputs[material], "entry": encode(endgame, "  ")}
+
+    entries = ((material, state[material]["entry"]) for material in materials)
+    if args.output == "-":
+        count = write_stats(sys.stdout, entries)
+    else:
+        tmp = f"{args.output}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            count = write_stats(f, entries)
+        os.replace(tmp, args.output)
+
+    if args.state:
+        tmp = f"{args.state}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({material: state[material] for material in materials}, f)
+        os.replace(tmp, args.state)
+
+    print(f"{count} endgames, {len(changed)} rebuilt", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+
+"""
+Verifies a local mirror of the Syzygy tablebases against the published
+checksums (checksums/bytes.tsv, checksums/md5, checksums/sha256, ...).
+
+Tables (*.rtbw, *.rtbz) are found recursively in the given directories.
+Sizes are checked first, so that truncated downloads fail immediately.
+Then each file is read exactly once, feeding all requested hashes, in a
+process pool. Use --per-disk to limit concurrent reads per device, for
+example to 1 for spinning disks.
+
+With --journal, results are appended to a file as they complete, and
+files already verified (unchanged since) are skipped when resuming:
+
+    python util/verify.py /mnt/syzygy --algorithm sha256 --journal verify.journal
+
+BLAKE3 (b3) requires the blake3 package.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import time
+
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+try:
+    import blake3  # type: ignore
+except ImportError:
+    blake3 = None
+
+
+ALGORITHMS = ["md5", "sha1", "sha256", "sha512", "sha3-224", "b2", "b3"]
+
+
+def hasher(algorithm: str) -> Any:
+    if algorithm == "b2":
+        return hashlib.blake2b()
+    elif algorithm == "b3":
+        return blake3.blake3()
+    elif algorithm == "sha3-224":
+        return hashlib.sha3_224()
+    else:
+        return hashlib.new(algorithm)
+
+
+def read_expected(directory: str, algorithms: List[str]) -> Tuple[Dict[str, int], Dict[str, Dict[str, str]]]:
+    sizes = {}
+    with open(os.path.join(directory, "bytes.tsv")) as f:
+        for line in f:
+            size, filename = line.split()
+            sizes[filename] = int(size)
+
+    hashes: Dict[str, Dict[str, str]] = collections.defaultdict(dict)
+    for algorithm in algorithms:
+        with open(os.path.join(directory, algorithm)) as f:
+            for line in f:
+                h, filename = line.split()
+                hashes[filename][algorithm] = h
+
+    return sizes, hashes
+
+
+class Table(NamedTuple):
+    filename: str
+    path: str
+    size: int
+    mtime: int
+    device: int
+
+
+def find_tables(directories: List[str]) -> Dict[str, Table]:
+    tables = {}
+    for directory in directories:
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.endswith((".rtbw", ".rtbz")):
+                    path = os.path.join(dirpath, filename)
+                    stat = os.stat(path)
+                    tables[filename] = Table(filename, path, stat.st_size, stat.st_mtime_ns, stat.st_dev)
+    return tables
+
+
+def hash_file(path: str, algorithms: List[str], buffer_size: int) -> Dict[str, str]:
+    # Read once, in large chunks, and feed every hash.
+    hashers = [hasher(algorithm) for algorithm in algorithms]
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            chunk = view[:n]
+            for h in hashers:
+                h.update(chunk)
+    return {algorithm: h.hexdigest() for algorithm, h in zip(algorithms, hashers)}
+
+
+def read_journal(path: str) -> Dict[str, Dict[str, Any]]:
+    done = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Interrupted while writing.
+                done[entry["file"]] = entry
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directories", nargs="+", help="local tablebase directories")
+    parser.add_argument("--checksums", default=os.path.join(os.path.dirname(__file__), "..", "checksums"))
+    parser.add_argument("--algorithm", action="append", choices=ALGORITHMS, help="may be repeated, defaults to all available")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--per-disk", type=int, default=0, help="concurrent reads per device, 0 for no limit")
+    parser.add_argument("--buffer", type=int, default=16, help="read buffer size in MiB")
+    parser.add_argument("--journal", help="append results to this file, and skip files already verified")
+    parser.add_argument("--ignore-missing", action="store_true", help="do not fail for tables missing locally")
+    args = parser.parse_args(argv)
+
+    algorithms = args.algorithm or [algorithm for algorithm in ALGORITHMS if algorithm != "b3" or blake3 is not None]
+    if "b3" in algorithms and blake3 is None:
+        parser.error("b3 requires the blake3 package")
+
+    sizes, hashes = read_expected(args.checksums, algorithms)
+    tables = find_tables(args.directories)
+
+    failed = 0
+    missing = sorted(set(sizes) - set(tables))
+    if not args.ignore_missing:
+        for filename in missing:
+            print(f"MISSING {filename}")
+        failed += len(missing)
+
+    journal_entries = read_journal(args.journal) if args.journal else {}
+    journal = open(args.journal, "a") if args.journal else None
+
+    def record(table: Table, errors: List[str], verified: List[str]) -> None:
+        nonlocal failed
+        if errors:
+            failed += 1
+            print(f"FAILED {table.filename}: {', '.join(errors)}")
+        else:
+            print(f"OK {table.filename}")
+        if journal is not None:
+            journal.write(json.dumps({
+                "file": table.filename,
+                "size": table.size,
+                "mtime": table.mtime,
+                "algorithms": verified,
+                "errors": errors,
+            }) + "\n")
+            journal.flush()
+
+    # Check sizes before reading anything, and skip what the journal
+    # already covers.
+    pending: List[Table] = []
+    skipped = 0
+    for filename, table in sorted(tables.items()):
+        if filename not in sizes:
+            record(table, ["unknown table"], [])
+        elif table.size != sizes[filename]:
+            record(table, [f"size {table.size}, expected {sizes[filename]}"], [])
+        else:
+            entry = journal_entries.get(filename)
+            if (
+                entry is not None
+                and not entry["errors"]
+                and entry["size"] == table.size
+                and entry["mtime"] == table.mtime
+                and set(algorithms) <= set(entry["algorithms"])
+            ):
+                skipped += 1
+            else:
+                pending.append(table)
+
+    # Largest first, to balance the tail.
+    pending.sort(key=lambda table: table.size, reverse=True)
+    total_bytes = sum(table.size for table in pending)
+    started = time.monotonic()
+
+    busy: Dict[int, int] = collections.Counter()
+    running: Dict[concurrent.futures.Future[Dict[str, str]], Table] = {}
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            while pending or running:
+                # Fill free workers, respecting the limit per device.
+                index = 0
+                while len(running) < args.jobs and index < len(pending):
+                    table = pending[index]
+                    if args.per_disk and busy[table.device] >= args.per_disk:
+                        index += 1
+                        continue
+                    del pending[index]
+                    busy[table.device] += 1
+                    running[executor.submit(hash_file, table.path, algorithms, args.buffer << 20)] = table
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    table = running.pop(future)
+                    busy[table.device] -= 1
+                    try:
+                        actual = future.result()
+                    except OSError as err:
+                        record(table, [str(err)], [])
+                        continue
+                    expected = hashes.get(table.filename, {})
+                    errors = [
+                        f"{algorithm} mismatch" if algorithm in expected else f"{algorithm} not published"
+                        for algorithm in algorithms
+                        if actual[algorithm] != expected.get(algorithm)
+                    ]
+                    record(table, errors, algorithms)
+    finally:
+        if journal is not None:
+            journal.close()
+
+    elapsed = time.monotonic() - started
+    print(
+        f"{len(tables)} tables found, {skipped} already verified, {len(missing)} missing, {failed} failed; "
+        f"hashed {total_bytes / 1e9:.1f} GB in {elapsed:.0f} s ({total_bytes / 1e6 / max(elapsed, 1e-9):.0f} MB/s)",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))